@@ -0,0 +1,215 @@
+"""
+Query and latency budgets of the root fields of the schema. Each root field
+declares the maximum number of SQL statements and milliseconds it may take as a
+function of the rows it returns, for a selection of its own (scalar) fields.
+
+The budgets are asserted by the tests (see ideary.testing.BudgetTestCase) and, when
+GRAPHQL_LOG_BUDGET_VIOLATIONS is on, checked at runtime for every request, logging
+the operations that exceed them (or have root fields without a budget). The root
+fields are identified by their name in the document, whatever their alias.
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from graphql.language import ast
+
+from ideary.sharding import get_shards
+
+logger = logging.getLogger(__name__)
+
+
+class Budget:
+    """
+    Maximum SQL statements and milliseconds of a root field returning `rows` rows
+    from `shards` shards: queries + queries_per_row * rows + queries_per_shard *
+    (shards - 1) and ms + ms_per_row * rows
+    """
+
+    def __init__(
+        self, queries, queries_per_row=0, queries_per_shard=0, ms=100, ms_per_row=1
+    ):
+        self.queries = queries
+        self.queries_per_row = queries_per_row
+        self.queries_per_shard = queries_per_shard
+        self.ms = ms
+        self.ms_per_row = ms_per_row
+
+    def max_queries(self, rows, shards=1):
+        return (
+            self.queries
+            + self.queries_per_row * rows
+            + self.queries_per_shard * (shards - 1)
+        )
+
+    def max_ms(self, rows):
+        return self.ms + self.ms_per_row * rows
+
+
+# The counts include the authentication of the logged user by its JWT (see
+# graphql_jwt.middleware.JSONWebTokenMiddleware) and the lookup of its Profile when
+# the identity cache is cold (see profiles_services.get_user_profile). The fields
+# scattered to every shard (see ideary.sharding) have a cost per extra shard
+BUDGETS = {
+    # ideas.schema
+    "ideas": Budget(queries=3, queries_per_shard=1),
+    "publicIdeas": Budget(queries=1, queries_per_shard=1),
+    "myIdeas": Budget(queries=4),
+    "timeline": Budget(queries=3, queries_per_shard=1),
+    "profileIdeas": Budget(queries=4),
+    "createIdea": Budget(queries=3),
+    "updateIdea": Budget(queries=4),
+    "deleteIdea": Budget(queries=4),
+    # profiles.schema
+    "profiles": Budget(queries=1),
+    "searchableProfiles": Budget(queries=1),
+    "profilesSearch": Budget(queries=2),
+    "users": Budget(queries=1),
+    "me": Budget(queries=1),
+    "followers": Budget(queries=4, queries_per_shard=1),
+    "following": Budget(queries=4, queries_per_shard=2),
+    "myFollowRequests": Budget(queries=4),
+    "createUser": Budget(queries=2),
+    "updatePassword": Budget(queries=2),
+    "deleteAccount": Budget(queries=7, queries_per_shard=1),
+    "createFollowRequest": Budget(queries=3, queries_per_shard=1),
+    "acceptFollowRequest": Budget(queries=3),
+    "denyFollowRequest": Budget(queries=3),
+    "stopFollowing": Budget(queries=3),
+    "deleteFollower": Budget(queries=3),
+    # ideary.schema
+    "tokenAuth": Budget(queries=2),
+    "verifyToken": Budget(queries=0),
+    "refreshToken": Budget(queries=1),
+}
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts the executed SQL statements
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(execute):
+    """
+    Calls execute() (that executes a GraphQL operation) and returns its result, the
+    SQL statements it ran and the milliseconds it took
+    """
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        # Counting the statements of every database (shard)
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        result = execute()
+    return result, counter.count, (time.perf_counter() - start) * 1000
+
+
+def get_root_fields(document, operation_name=None):
+    """
+    Returns the root fields of the operation (the only one if operation_name is None)
+    of a parsed document (ast.Document): a dict of their keys in the result data
+    (their alias or name) to their names. The fragments are expanded and the
+    introspection fields skipped
+    """
+    operations = {}
+    fragments = {}
+    for definition in document.definitions:
+        if isinstance(definition, ast.OperationDefinition):
+            operations[definition.name and definition.name.value] = definition
+        elif isinstance(definition, ast.FragmentDefinition):
+            fragments[definition.name.value] = definition
+    if operation_name is None and len(operations) == 1:
+        operation_name = next(iter(operations))
+    operation = operations.get(operation_name)
+    fields = {}
+
+    def add_fields(selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                name = selection.name.value
+                if not name.startswith("__"):
+                    fields[(selection.alias or selection.name).value] = name
+            elif isinstance(selection, ast.FragmentSpread):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    add_fields(fragment.selection_set)
+            else:
+                add_fields(selection.selection_set)
+
+    if operation is not None:
+        add_fields(operation.selection_set)
+    return fields
+
+
+def get_rows(value):
+    """
+    Returns the rows of the value of a root field: the items of a list or the edges
+    of a connection, 1 otherwise
+    """
+    if isinstance(value, dict) and isinstance(value.get("edges"), list):
+        return len(value["edges"])
+    return len(value) if isinstance(value, list) else 1
+
+
+def get_allowance(data, fields):
+    """
+    Returns the maximum SQL statements and milliseconds allowed for the result data
+    of an operation (the sum of the budgets of its root fields, see get_root_fields)
+    and the names of its root fields without a budget, which allow nothing
+    """
+    max_queries = max_ms = 0
+    missing = []
+    shards = len(get_shards())
+    for key, value in (data or {}).items():
+        name = fields.get(key, key)
+        budget = BUDGETS.get(name)
+        if budget is None:
+            missing.append(name)
+            continue
+        rows = get_rows(value)
+        max_queries += budget.max_queries(rows, shards)
+        max_ms += budget.max_ms(rows)
+    return max_queries, max_ms, missing
+
+
+def get_violations(data, fields, queries, ms):
+    """
+    Returns the list of the budgets exceeded by an operation (with the given root
+    fields, see get_root_fields) that returned data, running `queries` SQL
+    statements in `ms` milliseconds
+    """
+    max_queries, max_ms, missing = get_allowance(data, fields)
+    violations = [f"{name} has no budget" for name in missing]
+    if queries > max_queries:
+        violations.append(f"{queries} SQL statements (budget: {max_queries})")
+    if ms > max_ms:
+        violations.append(f"{ms:.1f} ms (budget: {max_ms:.1f} ms)")
+    return violations
+
+
+def execute_within_budget(execute, fields, operation_name):
+    """
+    Calls execute() (that executes a GraphQL operation with the given root fields,
+    see get_root_fields) logging a warning if it exceeds the budgets of its root
+    fields. Returns its result
+    """
+    result, queries, ms = measure(execute)
+    if result is not None and not result.invalid:
+        violations = get_violations(result.data, fields, queries, ms)
+        if violations:
+            logger.warning(
+                "Operation %s (%s) exceeded its budget: %s",
+                operation_name,
+                ", ".join(fields.values()),
+                "; ".join(violations),
+            )
+    return result
@@ -0,0 +1,70 @@
+"""
+Identity cache: model instances by primary key, shared across requests through the
+"identity" cache (see CACHES in settings.py). Only the Profiles are cached (and the
+Profile id of each User, see profiles_services.get_user_profile). Its entries are
+removed by the post_save/post_delete signals of the Profiles, and bumping the VERSION
+of the cache discards all of them at once (e.g. when the Profile model changes).
+
+The signals only evict the entries of the process that made the change (the cache is
+per process), so the others may serve them for up to its TIMEOUT. Never cache what
+must apply right away (the Users, with their is_active and password), nor save the
+cached instances: read what's about to be written from the database and update only
+the changed fields.
+"""
+from django.core.cache import caches
+from django.db import transaction
+
+IDENTITY_CACHE = "identity"
+
+
+def get_identity_cache():
+    return caches[IDENTITY_CACHE]
+
+
+def get_cache_key(model, key, field="pk"):
+    return f"{model._meta.label_lower}:{field}:{key}"
+
+
+def get_cached_object(model, pk, using=None):
+    """
+    Returns the instance of model with the given primary key, from the identity
+    cache if it's there (or the `using` database otherwise). Raises
+    model.DoesNotExist as `objects.get` does
+    """
+    cache = get_identity_cache()
+    cache_key = get_cache_key(model, pk)
+    instance = cache.get(cache_key)
+    if instance is None:
+        instance = model._default_manager.using(using).get(pk=pk)
+        cache.set(cache_key, instance)
+    return instance
+
+
+def get_cached_value(model, field, key, default):
+    """
+    Returns a value cached by a field of model (e.g. the pk of a User by its
+    username), calling default() to get and cache it when it's not there
+    """
+    cache = get_identity_cache()
+    cache_key = get_cache_key(model, key, field)
+    value = cache.get(cache_key)
+    if value is None:
+        value = default()
+        if value is not None:
+            cache.set(cache_key, value)
+    return value
+
+
+def invalidate_cached_object(model, pk, **fields):
+    """
+    Removes from the identity cache the instance of model with the given primary key
+    and the values cached by its fields (e.g. username="..."). They are removed now
+    and again when the transaction commits, so no concurrent request keeps caching
+    the version previous to the commit
+    """
+    cache_keys = [get_cache_key(model, pk)] + [
+        get_cache_key(model, key, field) for field, key in fields.items()
+    ]
+    cache = get_identity_cache()
+    cache.delete_many(cache_keys)
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
@@ -0,0 +1,14 @@
+from ideary.throttling import get_client_key, get_rate_limiter
+
+
+class RateLimitMiddleware:
+    """
+    Graphene middleware that rate limits the root fields of the operations per
+    client (see GRAPHQL_RATE_LIMITS). It must be listed before the JWT middleware,
+    so the user of the request is already authenticated when it runs
+    """
+
+    def resolve(self, next, root, info, **kwargs):
+        if len(info.path) == 1:
+            get_rate_limiter().check(get_client_key(info.context), info.field_name)
+        return next(root, info, **kwargs)
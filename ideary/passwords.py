@@ -0,0 +1,135 @@
+"""
+Password hashing and verification off the request threads. They run in a pool of
+processes admitted by a ConcurrencyLimiter of its own (see PASSWORD_HASHING_POOL), so
+a signup or login burst queues there (or is shed with an OverloadedError) instead of
+taking the CPU of the workers serving the reads. The request thread just waits (with
+the GIL released) for the result.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from ideary.throttling import ConcurrencyLimiter, OverloadedError
+
+logger = logging.getLogger(__name__)
+
+
+def _setup_worker():
+    django.setup()
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _check_password(password, encoded):
+    """
+    Returns whether password matches the encoded one and whether encoded must be
+    upgraded to the preferred hasher (the first of PASSWORD_HASHERS)
+    """
+    must_update = []
+    valid = hashers.check_password(
+        password, encoded, setter=lambda raw_password: must_update.append(True)
+    )
+    return valid, bool(must_update)
+
+
+class PasswordPool:
+    """
+    Pool of `workers` processes. Up to max_waiting more calls wait (at most `timeout`
+    seconds) for a free worker, the rest are shed
+    """
+
+    def __init__(self, workers, max_waiting, timeout):
+        self.workers = workers
+        self.limiter = ConcurrencyLimiter(
+            "password hashing", workers, max_waiting, timeout
+        )
+        # Spawned (not forked) processes, so they don't inherit the threads and the
+        # database connections of the web worker
+        self.executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_setup_worker,
+        )
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.wait_time = 0
+        self.run_time = 0
+
+    def run(self, function, *args):
+        """
+        Runs function(*args) in a worker of the pool. Returns its result
+        """
+        queued = time.perf_counter()
+        try:
+            with self.limiter.slot():
+                started = time.perf_counter()
+                result = self.executor.submit(function, *args).result()
+        except OverloadedError:
+            logger.warning("Password hashing request shed: %s", self.metrics())
+            raise
+        finished = time.perf_counter()
+        with self.lock:
+            self.completed += 1
+            self.wait_time += started - queued
+            self.run_time += finished - started
+        return result
+
+    def metrics(self):
+        """
+        Returns the queue metrics of the pool
+        """
+        with self.lock:
+            completed = self.completed
+            wait_time = self.wait_time
+            run_time = self.run_time
+        return {
+            "workers": self.workers,
+            "running": self.limiter.running,
+            "waiting": self.limiter.waiting,
+            "shed": self.limiter.shed,
+            "completed": completed,
+            "avg_wait_ms": wait_time * 1000 / completed if completed else 0,
+            "avg_run_ms": run_time * 1000 / completed if completed else 0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_password_pool():
+    """
+    Returns the PasswordPool of this process, configured by PASSWORD_HASHING_POOL.
+    None if its workers are 0 (hashing on the calling thread)
+    """
+    config = settings.PASSWORD_HASHING_POOL
+    if not config["workers"]:
+        return None
+    return PasswordPool(**config)
+
+
+def hash_password(password):
+    """
+    Same as django.contrib.auth.hashers.make_password, in the password pool
+    """
+    pool = get_password_pool()
+    if pool is None or password is None:
+        return _make_password(password)
+    return pool.run(_make_password, password)
+
+
+def verify_password(password, encoded):
+    """
+    Returns whether password matches the encoded one and whether encoded must be
+    upgraded to the preferred hasher, verifying it in the password pool
+    """
+    pool = get_password_pool()
+    if pool is None or password is None or not hashers.is_password_usable(encoded):
+        return _check_password(password, encoded)
+    return pool.run(_check_password, password, encoded)
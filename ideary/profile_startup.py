@@ -0,0 +1,120 @@
+"""
+Reports the cost of the cold start of a worker: the time spent in each start up
+stage (settings, apps loading, schema modules import, schema build, introspection)
+and, optionally, the modules that take longer to import.
+
+Run it in a fresh process, as it measures the first imports:
+
+    python -m ideary.profile_startup [--imports] [--top 20]
+"""
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+SCHEMA_MODULES = ["profiles.schema", "ideas.schema", "ideary.schema"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+class Timer:
+    def __init__(self):
+        self.stages = []
+
+    def measure(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.stages.append((name, time.perf_counter() - start))
+        return result
+
+    def report(self):
+        total = sum(elapsed for _, elapsed in self.stages)
+        for name, elapsed in self.stages:
+            print(f"{elapsed * 1000:10.1f} ms  {name}")
+        print(f"{total * 1000:10.1f} ms  total")
+
+
+def profile_stages():
+    """
+    Runs (and times) every start up stage of a worker in this process
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ideary.settings")
+    timer = Timer()
+
+    django = timer.measure("import django", importlib.import_module, "django")
+    from django.conf import settings
+
+    timer.measure("load settings", lambda: settings.INSTALLED_APPS)
+    timer.measure("django.setup() (apps and models)", django.setup)
+    for module in SCHEMA_MODULES:
+        # ideary.schema builds the schema while it's imported
+        timer.measure(f"import {module}", importlib.import_module, module)
+
+    import graphene
+    from ideary.schema import Mutation, Query
+
+    timer.measure(
+        "rebuild schema", lambda: graphene.Schema(query=Query, mutation=Mutation)
+    )
+    from ideary.schema import schema
+
+    timer.measure("introspection", schema.introspect)
+    timer.report()
+
+
+def profile_imports(top):
+    """
+    Runs the worker start up in a subprocess with `-X importtime` and reports the
+    top level packages that take longer to import (self time of their modules)
+    """
+    code = "import django; django.setup(); " + "; ".join(
+        f"import {module}" for module in SCHEMA_MODULES
+    )
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="ideary.settings")
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+
+    self_times = defaultdict(int)
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, _, _, module = match.groups()
+            self_times[module.split(".")[0]] += int(self_us)
+
+    ranking = sorted(self_times.items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in ranking[:top]:
+        print(f"{self_us / 1000:10.1f} ms  {package}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reports the cost of the cold start of a worker"
+    )
+    parser.add_argument(
+        "--imports",
+        action="store_true",
+        help="Also report the import time of each top level package",
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="Number of packages in the import report"
+    )
+    args = parser.parse_args()
+
+    print("Start up stages")
+    profile_stages()
+    if args.imports:
+        print(f"\nTop {args.top} packages by import time")
+        profile_imports(args.top)
+
+
+if __name__ == "__main__":
+    main()
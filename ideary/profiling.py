@@ -0,0 +1,200 @@
+"""
+On demand profiling of single GraphQL requests. A request is profiled when it has
+the X-Ideary-Profile header set to GRAPHQL_PROFILING_TOKEN, or randomly with a
+GRAPHQL_PROFILING_SAMPLE_RATE probability. For those requests only:
+- A statistical profiler samples the stack of the thread executing it every
+  GRAPHQL_PROFILING_INTERVAL seconds
+- Every SQL statement is logged with its duration
+Both are stored in GRAPHQL_PROFILING_DIR/<operation name>/ as <id>.folded (collapsed
+stacks, open it with speedscope or flamegraph.pl to get the flame graph) and
+<id>.json (the timings and the SQL log). The directory is pruned to the newest
+GRAPHQL_PROFILING_MAX_PROFILES profiles of the last GRAPHQL_PROFILING_MAX_AGE_DAYS.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_IDEARY_PROFILE"
+
+
+def should_profile(request):
+    """
+    Returns True if the request must be profiled
+    """
+    token = request.META.get(PROFILE_HEADER)
+    if token is not None and settings.GRAPHQL_PROFILING_TOKEN:
+        return hmac.compare_digest(token, settings.GRAPHQL_PROFILING_TOKEN)
+    sample_rate = settings.GRAPHQL_PROFILING_SAMPLE_RATE
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class StackSampler(threading.Thread):
+    """
+    Thread that samples the stack of another thread every `interval` seconds,
+    counting the times each (collapsed) stack is seen
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.labels = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(self.get_label(frame.f_code))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def get_label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            filename = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            label = self.labels[
+                code
+            ] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class QueryLog:
+    """
+    Database execute wrapper that logs every SQL statement with its duration
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries.append(
+                {
+                    "database": context["connection"].alias,
+                    "sql": sql,
+                    "duration_ms": duration * 1000,
+                }
+            )
+
+
+def save_profile(operation_name, stacks, queries, duration):
+    """
+    Stores the collapsed stacks and the SQL log of a profiled request. Returns the
+    path of the stored profile (without extension)
+    """
+    directory = os.path.join(
+        settings.GRAPHQL_PROFILING_DIR, re.sub(r"[^\w-]", "_", operation_name)
+    )
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, profile_id)
+
+    with open(f"{path}.folded", "w") as folded:
+        for stack, count in stacks.items():
+            folded.write(f"{stack} {count}\n")
+    with open(f"{path}.json", "w") as log:
+        json.dump(
+            {
+                "operation": operation_name,
+                "duration_ms": duration * 1000,
+                "sql_count": len(queries),
+                "sql_duration_ms": sum(query["duration_ms"] for query in queries),
+                "queries": queries,
+            },
+            log,
+            indent=2,
+        )
+    return path
+
+
+def prune_profiles():
+    """
+    Removes the stored profiles older than GRAPHQL_PROFILING_MAX_AGE_DAYS and the
+    oldest ones beyond GRAPHQL_PROFILING_MAX_PROFILES (of every operation), and the
+    emptied operation directories. Returns the number of removed profiles
+    """
+    root = settings.GRAPHQL_PROFILING_DIR
+    if not os.path.isdir(root):
+        return 0
+    profiles = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            base, extension = os.path.splitext(path)
+            if extension in (".folded", ".json"):
+                mtime = os.path.getmtime(path)
+                profiles[base] = max(profiles.get(base, 0), mtime)
+
+    oldest = time.time() - settings.GRAPHQL_PROFILING_MAX_AGE_DAYS * 86400
+    newest_first = sorted(profiles, key=profiles.get, reverse=True)
+    expired = [
+        base
+        for index, base in enumerate(newest_first)
+        if index >= settings.GRAPHQL_PROFILING_MAX_PROFILES or profiles[base] < oldest
+    ]
+    for base in expired:
+        for extension in (".folded", ".json"):
+            try:
+                os.remove(base + extension)
+            except FileNotFoundError:
+                pass
+    for directory in {os.path.dirname(base) for base in expired} - {root}:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            # Not empty (or removed by a concurrent request)
+            pass
+    return len(expired)
+
+
+@contextmanager
+def profile_execution(operation_name):
+    """
+    Profiles the block (run by the current thread) and stores its profile
+    """
+    sampler = StackSampler(threading.get_ident(), settings.GRAPHQL_PROFILING_INTERVAL)
+    query_log = QueryLog()
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(query_log))
+            yield
+    finally:
+        sampler.stop()
+        duration = time.perf_counter() - start
+        try:
+            path = save_profile(
+                operation_name, sampler.stacks, query_log.queries, duration
+            )
+            logger.info("Profile of %s stored in %s", operation_name, path)
+            prune_profiles()
+        except OSError:
+            logger.exception("The profile of %s couldn't be stored", operation_name)
@@ -0,0 +1,109 @@
+"""
+Read-only fast path of the list fields. When the selection set of a list of a
+DjangoObjectType only asks for scalar columns of its model, its queryset is turned
+into a values_list(named=True) projection of exactly those columns: the rows are
+fetched as lightweight namedtuples (resolved by the default attribute resolver)
+instead of hydrating a model instance per row. Otherwise the queryset is kept as is.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import ast
+
+
+def get_selected_fields(info):
+    """
+    Returns the names of the fields selected (directly or in fragments) on the
+    object type of the field being resolved
+    """
+    names = set()
+    pending = [field_ast.selection_set for field_ast in info.field_asts]
+    while pending:
+        selection_set = pending.pop()
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                names.add(selection.name.value)
+            elif isinstance(selection, ast.InlineFragment):
+                pending.append(selection.selection_set)
+            elif isinstance(selection, ast.FragmentSpread):
+                pending.append(info.fragments[selection.name.value].selection_set)
+    return names
+
+
+def get_object_type(info):
+    """
+    Returns the graphene type of the items of the field being resolved
+    """
+    graphql_type = info.return_type
+    while hasattr(graphql_type, "of_type"):
+        graphql_type = graphql_type.of_type
+    return getattr(graphql_type, "graphene_type", None)
+
+
+def get_columns(object_type, names):
+    """
+    Returns the model columns needed to resolve the fields `names` of object_type (a
+    ProjectableType), None if any of them is not a scalar column (a relation or a
+    field with a resolver of its own). `pk` is always included, as the `id` fields
+    are resolved from it
+    """
+    model = object_type._meta.model
+    columns = ["pk"]
+    for name in sorted(names):
+        if name == "__typename":
+            continue
+        name = to_snake_case(name)
+        if name == "id":
+            continue
+        if getattr(object_type, f"resolve_{name}", None) is not None:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.is_relation or not field.concrete:
+            return None
+        columns.append(name)
+    return columns
+
+
+def project(queryset, info):
+    """
+    Returns the values_list projection of queryset with the columns selected in the
+    field being resolved (plus the ones it's ordered by, e.g. to merge the shards),
+    or queryset itself if its items have non scalar fields selected
+    """
+    object_type = get_object_type(info)
+    if object_type is None or not issubclass(object_type, ProjectableType):
+        return queryset
+    columns = get_columns(object_type, get_selected_fields(info))
+    if columns is None:
+        return queryset
+    for ordering in queryset.query.order_by:
+        if not isinstance(ordering, str):
+            return queryset
+        column = ordering.lstrip("-")
+        if column not in columns:
+            columns.append(column)
+    return queryset.values_list(*columns, named=True)
+
+
+def is_projected_row(root):
+    """
+    Returns whether root is a row of a values_list(named=True) projection
+    """
+    return isinstance(root, tuple) and hasattr(root, "_fields")
+
+
+class ProjectableType:
+    """
+    Mixin of the DjangoObjectTypes whose lists may be projected (see project),
+    accepting the projected rows as values of the type
+    """
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        if is_projected_row(root):
+            return True
+        return super().is_type_of(root, info)
@@ -0,0 +1,80 @@
+"""
+JSON encoding of the GraphQL responses. orjson is used when it's installed (it's
+several times faster than the standard json module), falling back to json with the
+same output (UTF-8, not escaped).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(obj):
+    """
+    Encodes obj as compact JSON, returning bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def dumps_pretty(obj):
+    """
+    Encodes obj as indented JSON with sorted keys, returning bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        obj, sort_keys=True, indent=2, separators=(",", ": "), ensure_ascii=False
+    ).encode()
+
+
+def _iter_list(items, chunk_size):
+    yield b"["
+    for start in range(0, len(items), chunk_size):
+        chunk = b",".join(dumps(item) for item in items[start : start + chunk_size])
+        yield chunk if start == 0 else b"," + chunk
+    yield b"]"
+
+
+def _iter_object(obj, stream_threshold, chunk_size):
+    yield b"{"
+    for index, (key, value) in enumerate(obj.items()):
+        yield (b"," if index else b"") + dumps(key) + b":"
+        if isinstance(value, list) and len(value) > stream_threshold:
+            yield from _iter_list(value, chunk_size)
+        else:
+            yield dumps(value)
+    yield b"}"
+
+
+def iter_response(response, stream_threshold, chunk_size):
+    """
+    Encodes the GraphQL response incrementally, yielding chunks of bytes. The top
+    level lists in `data` longer than stream_threshold are encoded chunk_size items
+    at a time, so the whole document is never held as a single string
+    """
+    yield b"{"
+    for index, (key, value) in enumerate(response.items()):
+        yield (b"," if index else b"") + dumps(key) + b":"
+        if key == "data" and isinstance(value, dict):
+            yield from _iter_object(value, stream_threshold, chunk_size)
+        else:
+            yield dumps(value)
+    yield b"}"
+
+
+def should_stream(response, stream_threshold):
+    """
+    Returns True if any top level list in the `data` of the response is longer than
+    stream_threshold
+    """
+    data = response.get("data")
+    if not isinstance(data, dict):
+        return False
+    return any(
+        isinstance(value, list) and len(value) > stream_threshold
+        for value in data.values()
+    )
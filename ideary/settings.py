@@ -38,7 +38,6 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     # Third Party
-    "django_extensions",
     "graphene_django",
     "django_filters",
     # Ideary apps
@@ -46,6 +45,10 @@ INSTALLED_APPS = [
     "profiles",
 ]
 
+if DEBUG:
+    # Development tools only, they slow down the start up of the workers
+    INSTALLED_APPS.append("django_extensions")
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -91,6 +94,35 @@ DATABASES = {
     }
 }
 
+# Shards of the data owned by the Profiles (see ideary/sharding.py): the database
+# alias (of DATABASES) of each shard and the first Profile id it holds. To add a node,
+# migrate its database and append it with a first_profile_id over the current
+# Profile ids, so the new Profiles are created there and nothing has to be moved
+IDEARY_SHARDS = [
+    {"database": "default", "first_profile_id": 1},
+]
+
+DATABASE_ROUTERS = ["ideary.sharding.ShardRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Profile instances and ids (see ideary/identity_cache.py). Bump VERSION when the
+    # Profile model changes to discard the cached instances
+    "identity": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "identity",
+        "TIMEOUT": 300,
+        "VERSION": 1,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -142,6 +174,85 @@ STATIC_URL = "/static/"
 GRAPHENE = {
     "SCHEMA": "ideary.schema.schema",
     "MIDDLEWARE": [
+        "ideary.middleware.RateLimitMiddleware",
         "graphql_jwt.middleware.JSONWebTokenMiddleware",
     ],
 }
+
+# Admission control (see ideary/throttling.py). All the limits are per process
+# Rate limits per client (user or IP) and root field: (requests per second, burst)
+GRAPHQL_RATE_LIMITS = {
+    "default": (10, 30),
+    "timeline": (2, 10),
+    "profilesSearch": (2, 10),
+}
+# Requests executed at the same time per operation type. Up to `max_waiting` more
+# wait `timeout` seconds for a free slot, the rest fail right away
+GRAPHQL_CONCURRENCY_LIMITS = {
+    "query": {"max_concurrent": 16, "max_waiting": 32, "timeout": 2},
+    "mutation": {"max_concurrent": 8, "max_waiting": 16, "timeout": 2},
+}
+
+# Password hashing and verification run in a pool of `workers` processes (0 hashes on
+# the request thread). Up to max_waiting more requests wait (at most `timeout`
+# seconds) for a free worker, the rest are shed (see ideary/passwords.py)
+PASSWORD_HASHING_POOL = {"workers": 2, "max_waiting": 32, "timeout": 5}
+
+# Cache warming (see ideary/warming.py). `warm_caches` warms the first `page_size`
+# ideas of the timelines of the Profiles logged in the last `active_days` and of the
+# profile ideas of the `popular` most followed Profiles, in `workers` threads running
+# up to `rate` tasks per second. Every login warms its Profile in a pool of
+# `login_workers` threads (0 disables it) running up to `login_rate` tasks per
+# second; the logins beyond `login_max_pending` queued ones aren't warmed
+CACHE_WARMING = {
+    "page_size": 20,
+    "active_days": 7,
+    "popular": 100,
+    "workers": 4,
+    "rate": 50,
+    "login_workers": 1,
+    "login_max_pending": 32,
+    "login_rate": 20,
+}
+
+
+# Group commit of the created Ideas (see ideas/group_commit.py): the Ideas created
+# within `window` seconds (up to `max_batch`) are inserted with a single INSERT and
+# commit. The Ideas not taken by a batch `timeout` seconds after the window fail
+# (and aren't created). A window of 0 inserts every Idea on its own. max_batch is
+# capped to the mutation `max_concurrent` of GRAPHQL_CONCURRENCY_LIMITS, as every
+# Idea waiting in a batch holds a slot
+IDEAS_GROUP_COMMIT = {"window": 0, "max_batch": 8, "timeout": 5}
+
+# FollowRequests resolved more than these days ago are moved to their history table
+# by `archive_followrequests`, so the live ones stay few
+FOLLOWREQUEST_RETENTION_DAYS = 30
+
+# Ideas partitioning (see ideas/partitioning.py)
+# Number of monthly partitions created in advance by `create_idea_partitions`
+IDEAS_PARTITION_MONTHS_AHEAD = 3
+# Partitions older than these months are moved to IDEAS_COLD_TABLESPACE (if set)
+IDEAS_HOT_MONTHS = 3
+IDEAS_COLD_TABLESPACE = None
+
+# GraphQL responses with top level lists longer than this are streamed to the client
+# GRAPHQL_STREAM_CHUNK_SIZE items at a time (None disables the streaming)
+GRAPHQL_STREAM_LIST_THRESHOLD = 500
+GRAPHQL_STREAM_CHUNK_SIZE = 100
+
+# On demand profiling of GraphQL requests (see ideary/profiling.py)
+# Requests with the X-Ideary-Profile header set to this token are profiled
+GRAPHQL_PROFILING_TOKEN = None
+# Probability of profiling any other request (0 disables the sampling)
+GRAPHQL_PROFILING_SAMPLE_RATE = 0
+# Seconds between stack samples of a profiled request
+GRAPHQL_PROFILING_INTERVAL = 0.002
+GRAPHQL_PROFILING_DIR = os.path.join(BASE_DIR, "graphql_profiles")
+# The profiles older than these days, and the oldest ones beyond this number, are
+# removed from GRAPHQL_PROFILING_DIR every time a profile is stored
+GRAPHQL_PROFILING_MAX_AGE_DAYS = 7
+GRAPHQL_PROFILING_MAX_PROFILES = 200
+
+# Log the GraphQL operations exceeding the query/latency budgets of their root fields
+# (see ideary/budgets.py)
+GRAPHQL_LOG_BUDGET_VIOLATIONS = True
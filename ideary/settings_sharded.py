@@ -0,0 +1,16 @@
+"""
+Settings with two shards (see ideary/sharding.py), to run the tests across shards:
+
+    python manage.py test --settings=ideary.settings_sharded
+
+The Profiles from the id 30 on live in the second shard.
+"""
+from ideary.settings import *  # noqa: F401,F403
+from ideary.settings import DATABASES
+
+DATABASES["shard1"] = dict(DATABASES["default"], NAME="ideary_shard1_db")
+
+IDEARY_SHARDS = [
+    {"database": "default", "first_profile_id": 1},
+    {"database": "shard1", "first_profile_id": 30},
+]
@@ -0,0 +1,200 @@
+"""
+Sharding of the data owned by the Profiles across several databases. The Users and
+Profiles live in the default database, while the rows owned by a Profile live in its
+shard (see IDEARY_SHARDS in settings.py):
+- Its Ideas
+- The FollowRequests it has received (and their archived history)
+- Its follower edges (profiles_profile_followers rows with it as from_profile)
+So the queries of a single Profile (its ideas, its follow requests, approving one...)
+run in a single shard, and the rest (timeline, public ideas...) are scattered to every
+shard and their results merged.
+
+Every shard has the whole schema (`migrate --database=<shard>`), and the ids of the
+rows created in the shard number n are in [n * SHARD_ID_RANGE + 1, (n + 1) *
+SHARD_ID_RANGE], so they are unique across shards and the shard of a row is known
+from its id. The sequences are set to those ranges after every migration.
+
+The Profiles are assigned to the shards by ranges of their ids, so every new Profile
+goes to the last shard: the load of the new Profiles isn't spread until another shard
+is appended.
+"""
+import heapq
+from bisect import bisect_right
+from functools import lru_cache
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SHARD_ID_RANGE = 100000000
+
+# Field with the id of the owner Profile of each sharded model
+SHARD_KEYS = {
+    "ideas.idea": "profile_id",
+    "profiles.followrequest": "requested_id",
+    "profiles.followrequesthistory": "requested_id",
+    "profiles.profile_followers": "from_profile_id",
+}
+
+
+def get_shards():
+    """
+    Returns the database aliases of the shards
+    """
+    return [shard["database"] for shard in settings.IDEARY_SHARDS]
+
+
+def is_sharded():
+    return len(settings.IDEARY_SHARDS) > 1
+
+
+@lru_cache(maxsize=None)
+def _get_first_profile_ids():
+    return [shard["first_profile_id"] for shard in settings.IDEARY_SHARDS]
+
+
+def get_shard(profile_id):
+    """
+    Returns the database alias of the shard of a Profile id
+    """
+    index = max(bisect_right(_get_first_profile_ids(), profile_id) - 1, 0)
+    return settings.IDEARY_SHARDS[index]["database"]
+
+
+class ShardRoutingError(Exception):
+    """
+    Raised by the queries of a sharded model whose shard isn't known (see
+    ShardRouter), instead of running them in the default database
+    """
+
+
+def get_shard_of_id(pk):
+    """
+    Returns the database alias of the shard where the row (of a sharded model) with
+    the given id was created, None if there is no shard for it (or it isn't an id)
+    """
+    if not isinstance(pk, int) or isinstance(pk, bool):
+        return None
+    index = (pk - 1) // SHARD_ID_RANGE
+    if 0 <= index < len(settings.IDEARY_SHARDS):
+        return settings.IDEARY_SHARDS[index]["database"]
+    return None
+
+
+def get_by_id(model, pk):
+    """
+    Returns the instance of a sharded model with the given id, read from the shard
+    the id belongs to. Raises model.DoesNotExist as `objects.get` does, also for the
+    ids out of the range of every shard
+    """
+    shard = get_shard_of_id(pk)
+    if shard is None:
+        raise model.DoesNotExist(f"{model._meta.object_name} {pk!r} is in no shard")
+    return model._default_manager.using(shard).get(pk=pk)
+
+
+def get_id_range(database):
+    """
+    Returns the first and last ids of the rows created in the shard
+    """
+    index = get_shards().index(database)
+    return index * SHARD_ID_RANGE + 1, (index + 1) * SHARD_ID_RANGE
+
+
+def set_id_range(connection, table):
+    """
+    Makes the id sequence of table (in the shard of the connection) generate the ids
+    of the range of the shard. Nothing is done when there is a single shard
+    """
+    if not is_sharded() or connection.vendor != "postgresql":
+        return
+    if connection.alias not in get_shards():
+        return
+    if table not in connection.introspection.table_names():
+        return
+    first, last = get_id_range(connection.alias)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT last_value FROM {sequence}")
+        if cursor.fetchone()[0] < first:
+            cursor.execute("SELECT setval(%s, %s, false)", [sequence, first])
+        cursor.execute(
+            f"ALTER SEQUENCE {sequence} START WITH {first} "
+            f"MINVALUE {first} MAXVALUE {last}"
+        )
+
+
+def gather(queryset, key="created", reverse=True):
+    """
+    Executes a queryset (ordered by key, descending if reverse) in every shard and
+    merges the results keeping that order. The queryset itself is returned when there
+    is a single shard
+    """
+    if not is_sharded():
+        return queryset
+    return list(
+        heapq.merge(
+            *(queryset.using(shard) for shard in get_shards()),
+            key=attrgetter(key),
+            reverse=reverse,
+        )
+    )
+
+
+def scatter(queryset):
+    """
+    Executes a queryset in every shard and returns all the results. The queryset
+    itself is returned when there is a single shard (so e.g. a values_list queryset
+    is used as a subquery)
+    """
+    if not is_sharded():
+        return queryset
+    return [result for shard in get_shards() for result in queryset.using(shard)]
+
+
+def values_in_default(queryset):
+    """
+    Returns the values of a values_list(flat=True) queryset (already routed to its
+    shard) to filter the models of the default database by them: the queryset itself
+    (a subquery) if it's in the default database, or its values otherwise
+    """
+    if queryset.db == DEFAULT_DB_ALIAS:
+        return queryset
+    return list(queryset)
+
+
+class ShardRouter:
+    """
+    Routes the sharded models (see SHARD_KEYS) to the shard of their owner Profile,
+    given by the `instance` hint (an instance of the model or its owner Profile, as
+    in profile.idea_set). The rest of the queries of the sharded models must choose
+    their shard with `using`: they raise ShardRoutingError when there are several
+    shards. The other models live in the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        key = SHARD_KEYS.get(model._meta.label_lower)
+        if key is None:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None:
+            if instance._meta.label_lower == "profiles.profile":
+                return get_shard(instance.pk)
+            profile_id = getattr(instance, key, None)
+            if profile_id is not None:
+                return get_shard(profile_id)
+        if is_sharded():
+            raise ShardRoutingError(
+                f"The shard of the {model._meta.label} query is unknown, choose it "
+                "with `using`"
+            )
+        return get_shards()[0]
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
@@ -0,0 +1,164 @@
+"""
+Test harness: seeds data and executes GraphQL operations (IdearyTestCase), and
+asserts that the root fields keep within their query budgets (see ideary.budgets)
+at several sizes (BudgetTestCase).
+"""
+import logging
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+from graphql.language.parser import parse
+from graphql_jwt.middleware import JSONWebTokenMiddleware
+from graphql_jwt.shortcuts import get_token
+
+from ideary.budgets import BUDGETS, get_allowance, get_root_fields, get_rows, measure
+from ideary.identity_cache import get_identity_cache
+from ideary.sharding import get_shard, get_shards
+from ideary.schema import schema
+from ideas.models import Idea
+from profiles.models import FollowRequest, User
+
+logger = logging.getLogger("ideary.budgets")
+
+
+class IdearyTestCase(TestCase):
+    """
+    TestCase with helpers to seed Users, ideas, followers and follow requests (in
+    the shards of their Profiles) and to execute GraphQL operations
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.users_created = 0
+
+    def create_user(self):
+        """
+        Creates a User (and its Profile). Returns its Profile
+        """
+        self.users_created += 1
+        username = f"{self._testMethodName}_{self.users_created}"
+        user = User.objects.create_user(
+            username=username, email=f"{username}@ideary.test"
+        )
+        return user.profile
+
+    def create_ideas(self, profile, count, visibility=Idea.PUBLIC):
+        return Idea.objects.using(get_shard(profile.pk)).bulk_create(
+            Idea(profile=profile, content=f"Idea {i}", visibility=visibility)
+            for i in range(count)
+        )
+
+    def count_ideas(self, **filters):
+        """
+        Returns the number of active Ideas matching filters in every shard
+        """
+        ideas = Idea.objects.active().filter(**filters)
+        return sum(ideas.using(shard).count() for shard in get_shards())
+
+    def create_followers(self, profile, count):
+        """
+        Creates `count` Profiles following profile. Returns them
+        """
+        followers = [self.create_user() for _ in range(count)]
+        profile.followers.add(*followers)
+        return followers
+
+    def create_followrequests(self, profile, count):
+        """
+        Creates `count` pending FollowRequests to profile. Returns their requestors
+        """
+        requestors = [self.create_user() for _ in range(count)]
+        FollowRequest.objects.using(get_shard(profile.pk)).bulk_create(
+            FollowRequest(requestor=requestor, requested=profile)
+            for requestor in requestors
+        )
+        return requestors
+
+    def execute(self, query, user=None, variables=None, cold=True):
+        """
+        Executes a query as user (anonymous if None), with a cold identity cache if
+        cold. The user is authenticated by its JWT during the execution, as in the
+        web requests. Returns its result, the SQL statements it ran and the
+        milliseconds it took
+        """
+        headers = {}
+        if user is not None:
+            headers["HTTP_AUTHORIZATION"] = f"JWT {get_token(user)}"
+        request = self.factory.post("/graphql/", **headers)
+        request.user = AnonymousUser()
+        if cold:
+            get_identity_cache().clear()
+        return measure(
+            lambda: schema.execute(
+                query,
+                context_value=request,
+                variables=variables,
+                middleware=[JSONWebTokenMiddleware()],
+            )
+        )
+
+    def assertProjected(self, field, fields, relation, user=None):
+        """
+        Asserts that the list field resolves the same values when only its scalar
+        `fields` are selected (projected rows, see ideary.projection) as when a
+        relation is selected too (model instances)
+        """
+        projected, _, _ = self.execute(f"{{ {field} {{ {fields} }} }}", user)
+        hydrated, _, _ = self.execute(
+            f"{{ {field} {{ {fields} {relation} {{ id }} }} }}", user
+        )
+        self.assertIsNone(projected.errors)
+        self.assertIsNone(hydrated.errors)
+        for item in hydrated.data[field]:
+            del item[relation]
+        self.assertEqual(projected.data[field], hydrated.data[field])
+
+
+class BudgetTestCase(IdearyTestCase):
+    """
+    TestCase asserting the query budgets of the root fields. The data is seeded for
+    every size of `sizes` (e.g. the number of ideas of a timeline) and the identity
+    cache is cleared before every execution, so the budgets hold for cold requests.
+    The time budgets depend on the machine running the tests, so they are only
+    reported (logged) when exceeded
+    """
+
+    sizes = [1, 10, 50]
+
+    def assertWithinBudget(self, field, query, rows, user=None, variables=None):
+        """
+        Asserts that the query (whose only root field is `field`) returns `rows`
+        rows within the query budget of the field
+        """
+        self.assertIn(field, BUDGETS, f"{field} has no budget")
+        fields = get_root_fields(parse(query))
+        self.assertEqual(list(fields.values()), [field])
+        result, queries, ms = self.execute(query, user, variables)
+        self.assertIsNone(result.errors)
+        self.assertEqual(get_rows(result.data[next(iter(fields))]), rows)
+        max_queries, max_ms, _ = get_allowance(result.data, fields)
+        self.assertLessEqual(
+            queries, max_queries, f"{field} ran too many SQL statements ({rows} rows)"
+        )
+        if ms > max_ms:
+            logger.warning(
+                "%s took %.1f ms with %s rows (budget: %.1f ms)",
+                field,
+                ms,
+                rows,
+                max_ms,
+            )
+
+    def assertWithinBudgets(self, field, query, seed):
+        """
+        Asserts the budget of the query (see assertWithinBudget) at every size of
+        `sizes`. seed(size) seeds the data of a size and returns the requests to
+        assert: the keyword arguments (rows, and optionally user and variables) of
+        assertWithinBudget
+        """
+        for size in self.sizes:
+            with self.subTest(size=size):
+                for request in seed(size):
+                    self.assertWithinBudget(field, query, **request)
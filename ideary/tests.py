@@ -0,0 +1,591 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2SHA1PasswordHasher, identify_hasher
+from django.test import TestCase, override_settings
+from graphql.language.parser import parse
+from graphql.utils.introspection_query import introspection_query
+
+from ideary import renderers
+from ideary.budgets import BUDGETS, Budget, get_root_fields, get_violations
+from ideary.passwords import (
+    PasswordPool,
+    _check_password,
+    _make_password,
+    get_password_pool,
+    hash_password,
+    verify_password,
+)
+from ideary.renderers import dumps, dumps_pretty, iter_response, should_stream
+from ideary.profiling import (
+    StackSampler,
+    profile_execution,
+    prune_profiles,
+    save_profile,
+    should_profile,
+)
+from ideary.schema import schema
+from ideary.sharding import (
+    ShardRoutingError,
+    _get_first_profile_ids,
+    gather,
+    get_id_range,
+    get_shard,
+    get_shard_of_id,
+    get_shards,
+    is_sharded,
+)
+from ideary.testing import BudgetTestCase, IdearyTestCase
+from ideary.throttling import OverloadedError, get_rate_limiter
+from ideary.views import get_introspection_result, is_introspection_query
+from ideas.models import Idea
+from profiles.models import DeletedProfile, FollowRequest, Profile, User
+from profiles.profiles_services import create_followrequest, request_account_deletion
+
+
+class BudgetsTest(BudgetTestCase):
+    def test_every_root_field(self):
+        for object_type in (schema.get_query_type(), schema.get_mutation_type()):
+            for field in object_type.fields:
+                self.assertIn(field, BUDGETS, f"{field} has no budget")
+
+    def test_root_fields(self):
+        """
+        The root fields are identified by name, whatever their alias, also in
+        fragments
+        """
+        document = parse(
+            """
+            query Feed { feed: publicIdeas { id } ...Mine ... on Query { me { id } } }
+            fragment Mine on Query { myIdeas { id } }
+            query Other { users { id } }
+            """
+        )
+        self.assertEqual(
+            get_root_fields(document, "Feed"),
+            {"feed": "publicIdeas", "myIdeas": "myIdeas", "me": "me"},
+        )
+        self.assertEqual(get_root_fields(document, "Other"), {"users": "users"})
+        self.assertEqual(
+            get_violations({"x": []}, {"x": "unknown"}, 0, 0), ["unknown has no budget"]
+        )
+
+    @override_settings(GRAPHQL_LOG_BUDGET_VIOLATIONS=True)
+    @mock.patch.dict(BUDGETS, {"publicIdeas": Budget(queries=0)})
+    def test_aliased_violation(self):
+        self.create_ideas(self.create_user(), 1)
+        with self.assertLogs("ideary.budgets", "WARNING") as logs:
+            self.client.post(
+                "/graphql/",
+                json.dumps({"query": "{ feed: publicIdeas { id } }"}),
+                content_type="application/json",
+            )
+        [message] = logs.output
+        self.assertIn("(publicIdeas) exceeded its budget", message)
+
+    @override_settings(
+        PASSWORD_HASHING_POOL={"workers": 0, "max_waiting": 0, "timeout": 5}
+    )
+    def test_token_mutations(self):
+        user = self.create_user().user
+        user.set_password("secret")
+        user.save(update_fields=["password"])
+        result, _, _ = self.execute(
+            f'mutation {{ tokenAuth(username: "{user.username}", password: "secret") '
+            "{ token } }"
+        )
+        token = result.data["tokenAuth"]["token"]
+        for field, query in [
+            (
+                "tokenAuth",
+                f'mutation {{ tokenAuth(username: "{user.username}", '
+                'password: "secret") { token } }',
+            ),
+            (
+                "verifyToken",
+                f'mutation {{ verifyToken(token: "{token}") {{ payload }} }}',
+            ),
+            (
+                "refreshToken",
+                f'mutation {{ refreshToken(token: "{token}") {{ token }} }}',
+            ),
+        ]:
+            with self.subTest(field=field):
+                self.assertWithinBudget(field, query, 1)
+
+
+class IntrospectionCacheTest(TestCase):
+    def setUp(self):
+        get_introspection_result.cache_clear()
+
+    def post(self, query, **data):
+        response = self.client.post(
+            "/graphql/",
+            json.dumps({"query": query, **data}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_introspection_query(self):
+        """
+        The cached introspection results are the same as executing the query
+        """
+        expected = schema.execute(introspection_query)
+        self.assertIsNone(expected.errors)
+        first = self.post(introspection_query)
+        second = self.post(introspection_query)
+        self.assertEqual(first, {"data": expected.data})
+        self.assertEqual(second, first)
+        info = get_introspection_result.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 1))
+
+    def test_operation_name(self):
+        query = """
+            query Idea { __type(name: "IdeaType") { name } }
+            query Root { __schema { queryType { name } } }
+        """
+        self.assertEqual(
+            self.post(query, operationName="Idea"),
+            {"data": {"__type": {"name": "IdeaType"}}},
+        )
+        self.assertEqual(
+            self.post(query, operationName="Root"),
+            {"data": {"__schema": {"queryType": {"name": "Query"}}}},
+        )
+
+    def test_is_introspection_query(self):
+        self.assertTrue(is_introspection_query(introspection_query))
+        self.assertTrue(is_introspection_query('{ __type(name: "IdeaType") { name } }'))
+        # Data fields (even along with introspection ones) are never cached
+        self.assertFalse(is_introspection_query("{ publicIdeas { id } }"))
+        self.assertFalse(
+            is_introspection_query("{ __schema { types { name } } publicIdeas { id } }")
+        )
+        self.assertFalse(
+            is_introspection_query("{ ...Root } fragment Root on Query { __schema }")
+        )
+        self.assertFalse(is_introspection_query("{ __schema { "))
+
+
+def json_dumps(obj):
+    """
+    Encodes obj as compact UTF-8 JSON with the json module
+    """
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class RenderersTest(TestCase):
+    response = {
+        "errors": [{"message": "Not allowed", "locations": [{"line": 1}]}],
+        "data": {
+            "publicIdeas": [
+                {"id": str(i), "content": f'Idea {i} \u00e9"\\', "score": i / 3}
+                for i in range(1000)
+            ],
+            "me": {"id": "1", "followers": [{"id": str(i)} for i in range(1000)]},
+            "empty": [],
+            "missing": None,
+        },
+    }
+
+    def test_dumps(self):
+        """
+        The renderers encode as the json module does
+        """
+        self.assertEqual(dumps(self.response), json_dumps(self.response))
+
+    def test_dumps_without_orjson(self):
+        expected = (dumps(self.response), dumps_pretty(self.response))
+        orjson = renderers.orjson
+        renderers.orjson = None
+        try:
+            self.assertEqual(
+                (dumps(self.response), dumps_pretty(self.response)), expected
+            )
+        finally:
+            renderers.orjson = orjson
+
+    def test_iter_response(self):
+        """
+        Streaming a response yields the same bytes as encoding it at once, whatever
+        lists are streamed and in which chunks
+        """
+        expected = dumps(self.response)
+        for threshold, chunk_size in [(0, 1), (10, 7), (500, 100), (999, 1000)]:
+            with self.subTest(threshold=threshold, chunk_size=chunk_size):
+                chunks = list(iter_response(self.response, threshold, chunk_size))
+                self.assertEqual(b"".join(chunks), expected)
+                if threshold < 1000:
+                    self.assertGreater(len(chunks), 1000 // chunk_size)
+
+    def test_should_stream(self):
+        self.assertTrue(should_stream(self.response, 999))
+        self.assertFalse(should_stream(self.response, 1000))
+        # Only the top level lists are streamed
+        self.assertFalse(should_stream({"data": {"me": self.response["data"]}}, 0))
+        self.assertFalse(should_stream({"errors": [{"message": "Invalid"}]}, 0))
+
+
+class StreamedResponseTest(IdearyTestCase):
+    def post(self, query):
+        return self.client.post(
+            "/graphql/", json.dumps({"query": query}), content_type="application/json"
+        )
+
+    def test_streamed_response(self):
+        """
+        The big lists are streamed with the same content as the unstreamed response
+        """
+        self.create_ideas(self.create_user(), 25)
+        query = "{ publicIdeas { id content visibility created } }"
+        with override_settings(GRAPHQL_STREAM_LIST_THRESHOLD=None):
+            response = self.post(query)
+        self.assertFalse(response.streaming)
+        with override_settings(
+            GRAPHQL_STREAM_LIST_THRESHOLD=10, GRAPHQL_STREAM_CHUNK_SIZE=4
+        ):
+            streamed = self.post(query)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed.status_code, response.status_code)
+        self.assertEqual(streamed["Content-Type"], "application/json")
+        self.assertEqual(b"".join(streamed.streaming_content), response.content)
+        self.assertEqual(
+            len(json.loads(response.content)["data"]["publicIdeas"]),
+            self.count_ideas(),
+        )
+
+
+class AdmissionControlTest(IdearyTestCase):
+    def setUp(self):
+        super().setUp()
+        get_rate_limiter.cache_clear()
+        self.addCleanup(get_rate_limiter.cache_clear)
+
+    def post(self, query):
+        return self.client.post(
+            "/graphql/", json.dumps({"query": query}), content_type="application/json"
+        )
+
+    @override_settings(GRAPHQL_RATE_LIMITS={"default": (0.001, 1)})
+    def test_rate_limited(self):
+        """
+        Once its rate is exhausted a client gets 429 with a Retry-After header
+        """
+        response = self.post("{ publicIdeas { id } }")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Retry-After", response)
+
+        response = self.post("{ publicIdeas { id } }")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1000")
+        [error] = json.loads(response.content)["errors"]
+        self.assertEqual(error["extensions"]["code"], "RATE_LIMITED")
+
+
+class PasswordPoolTest(IdearyTestCase):
+    def setUp(self):
+        super().setUp()
+        get_password_pool.cache_clear()
+        self.addCleanup(get_password_pool.cache_clear)
+
+    def create_pool(self, **config):
+        pool = PasswordPool(**{"workers": 1, "max_waiting": 0, "timeout": 5, **config})
+        self.addCleanup(pool.executor.shutdown)
+        return pool
+
+    def test_round_trip(self):
+        pool = self.create_pool()
+        encoded = pool.run(_make_password, "secret")
+        self.assertEqual(identify_hasher(encoded).algorithm, "pbkdf2_sha256")
+        self.assertEqual(pool.run(_check_password, "secret", encoded), (True, False))
+        self.assertEqual(pool.run(_check_password, "wrong", encoded), (False, False))
+        # The hashes of other hashers must be upgraded
+        outdated = PBKDF2SHA1PasswordHasher().encode("secret", "salt")
+        self.assertEqual(pool.run(_check_password, "secret", outdated), (True, True))
+        self.assertEqual(pool.metrics()["completed"], 4)
+
+    def test_shed(self):
+        """
+        The calls that can't get a worker (nor wait for one) are shed
+        """
+        pool = self.create_pool()
+        with pool.limiter.slot():
+            with self.assertRaises(OverloadedError):
+                pool.run(_make_password, "secret")
+        self.assertEqual(pool.metrics()["shed"], 1)
+        self.assertEqual(pool.metrics()["completed"], 0)
+
+    @override_settings(
+        PASSWORD_HASHING_POOL={"workers": 1, "max_waiting": 0, "timeout": 5}
+    )
+    def test_shed_login(self):
+        """
+        A login shed by the password pool gets 503 with a Retry-After header
+        """
+        User.objects.create_user(username="login", password="secret")
+        pool = get_password_pool()
+        self.addCleanup(pool.executor.shutdown)
+        query = """
+            mutation { tokenAuth(username: "login", password: "secret") { token } }
+        """
+        with pool.limiter.slot():
+            response = self.client.post(
+                "/graphql/",
+                json.dumps({"query": query}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        [error] = json.loads(response.content)["errors"]
+        self.assertEqual(error["extensions"]["code"], "OVERLOADED")
+
+        response = self.client.post(
+            "/graphql/", json.dumps({"query": query}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(json.loads(response.content)["data"]["tokenAuth"]["token"])
+
+    @override_settings(
+        PASSWORD_HASHING_POOL={"workers": 0, "max_waiting": 0, "timeout": 5}
+    )
+    def test_without_workers(self):
+        """
+        Without workers the passwords are hashed on the calling thread
+        """
+        self.assertIsNone(get_password_pool())
+        encoded = hash_password("secret")
+        self.assertEqual(verify_password("secret", encoded), (True, False))
+        self.assertEqual(verify_password("wrong", encoded), (False, False))
+
+        user = User.objects.create_user(username="outdated")
+        user.password = PBKDF2SHA1PasswordHasher().encode("secret", "salt")
+        self.assertTrue(user.check_password("secret"))
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, "pbkdf2_sha256")
+        self.assertTrue(user.check_password("secret"))
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class ProfilingTest(IdearyTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            GRAPHQL_PROFILING_DIR=self.directory, GRAPHQL_PROFILING_TOKEN="s3cret"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def list_profiles(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, filename), self.directory)
+            for directory, _, filenames in os.walk(self.directory)
+            for filename in filenames
+        )
+
+    def test_should_profile(self):
+        def request(**headers):
+            return self.factory.post("/graphql/", **headers)
+
+        self.assertTrue(should_profile(request(HTTP_X_IDEARY_PROFILE="s3cret")))
+        self.assertFalse(should_profile(request(HTTP_X_IDEARY_PROFILE="wrong")))
+        self.assertFalse(should_profile(request()))
+        with override_settings(GRAPHQL_PROFILING_SAMPLE_RATE=1):
+            self.assertTrue(should_profile(request()))
+            # A wrong token is never sampled
+            self.assertFalse(should_profile(request(HTTP_X_IDEARY_PROFILE="wrong")))
+        with override_settings(GRAPHQL_PROFILING_TOKEN=None):
+            self.assertFalse(should_profile(request(HTTP_X_IDEARY_PROFILE="s3cret")))
+
+    def test_stack_sampler(self):
+        sampler = StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy(0.1)
+        sampler.stop()
+        self.assertGreater(sum(sampler.stacks.values()), 0)
+        label = f"busy (ideary/tests.py:{busy.__code__.co_firstlineno})"
+        self.assertTrue(
+            any(stack.split(";")[-1] == label for stack in sampler.stacks),
+            sampler.stacks,
+        )
+
+    def test_profiled_request(self):
+        """
+        The requests with the profiling token store their stacks and SQL log
+        """
+        self.create_ideas(self.create_user(), 3)
+        response = self.client.post(
+            "/graphql/",
+            json.dumps({"query": "query Feed { publicIdeas { id } }"}),
+            content_type="application/json",
+            HTTP_X_IDEARY_PROFILE="s3cret",
+        )
+        self.assertEqual(response.status_code, 200)
+        [folded, log] = self.list_profiles()
+        self.assertTrue(folded.startswith("Feed/") and folded.endswith(".folded"))
+        self.assertEqual(log, folded.replace(".folded", ".json"))
+        with open(os.path.join(self.directory, log)) as log_file:
+            profile = json.load(log_file)
+        self.assertEqual(profile["operation"], "Feed")
+        self.assertGreater(profile["sql_count"], 0)
+        self.assertEqual(profile["sql_count"], len(profile["queries"]))
+        self.assertIn("ideas_idea", profile["queries"][-1]["sql"])
+
+    @override_settings(
+        GRAPHQL_PROFILING_MAX_PROFILES=2, GRAPHQL_PROFILING_MAX_AGE_DAYS=1
+    )
+    def test_prune_profiles(self):
+        """
+        Only the newest profiles of the last days are kept
+        """
+        now = time.time()
+        ages = {"old": 2 * 86400, "first": 30, "second": 20, "third": 10}
+        for operation, age in ages.items():
+            path = save_profile(operation, {"a;b": 1}, [], 0.1)
+            for extension in (".folded", ".json"):
+                os.utime(path + extension, (now - age, now - age))
+        self.assertEqual(prune_profiles(), 2)
+        self.assertEqual(
+            [os.path.dirname(path) for path in self.list_profiles()],
+            ["second", "second", "third", "third"],
+        )
+        self.assertEqual(sorted(os.listdir(self.directory)), ["second", "third"])
+
+    def test_profile_execution_prunes(self):
+        with override_settings(GRAPHQL_PROFILING_MAX_PROFILES=1):
+            for _ in range(3):
+                with profile_execution("op"):
+                    Profile.objects.count()
+        self.assertEqual(len(self.list_profiles()), 2)
+
+
+@skipUnless(is_sharded(), "run with --settings=ideary.settings_sharded")
+class ShardingTest(IdearyTestCase):
+    """
+    Every test has a Profile in the first shard and another in the second one
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.create_user()
+        shards = [dict(shard) for shard in settings.IDEARY_SHARDS[:2]]
+        shards[1]["first_profile_id"] = self.first.pk + 1
+        self.override_shards(shards)
+        self.second = self.create_user()
+        self.shards = get_shards()
+        self.assertEqual(get_shard(self.first.pk), self.shards[0])
+        self.assertEqual(get_shard(self.second.pk), self.shards[1])
+
+    def override_shards(self, shards):
+        override = override_settings(IDEARY_SHARDS=shards)
+        override.enable()
+        _get_first_profile_ids.cache_clear()
+        self.addCleanup(_get_first_profile_ids.cache_clear)
+        self.addCleanup(override.disable)
+
+    def assertInShard(self, queryset, shard):
+        """
+        Asserts that the rows of queryset are only in the given shard
+        """
+        for other in self.shards:
+            self.assertEqual(queryset.using(other).exists(), other == shard, other)
+
+    def test_routing(self):
+        """
+        The rows owned by a Profile are written to its shard
+        """
+        for profile, shard in zip([self.first, self.second], self.shards):
+            idea = profile.idea_set.create(content="Routed")
+            self.assertInShard(Idea.objects.filter(pk=idea.pk), shard)
+            follower = self.create_user()
+            profile.followers.add(follower)
+            self.assertInShard(
+                Profile.followers.through.objects.filter(
+                    from_profile=profile, to_profile=follower
+                ),
+                shard,
+            )
+            requestor = self.create_user()
+            create_followrequest(requestor.pk, profile.pk)
+            self.assertInShard(
+                FollowRequest.objects.filter(requestor=requestor, requested=profile),
+                shard,
+            )
+
+    def test_unrouted_query(self):
+        """
+        The queries of a sharded model without a shard fail instead of running in
+        the default database
+        """
+        with self.assertRaises(ShardRoutingError):
+            list(Idea.objects.all())
+        self.assertEqual(list(self.first.idea_set.all()), [])
+
+    def test_id_ranges(self):
+        """
+        The ids of the rows created in a shard are in its range
+        """
+        for profile, shard in zip([self.first, self.second], self.shards):
+            first, last = get_id_range(shard)
+            for idea in self.create_ideas(profile, 2):
+                self.assertTrue(first <= idea.pk <= last, idea.pk)
+                self.assertEqual(get_shard_of_id(idea.pk), shard)
+
+    def test_fan_out(self):
+        """
+        The reads of several Profiles merge the rows of every shard in order
+        """
+        ideas = [
+            idea
+            for _ in range(2)
+            for profile in (self.first, self.second)
+            for idea in self.create_ideas(profile, 1)
+        ]
+        expected = [idea.pk for idea in reversed(ideas)]
+        merged = gather(Idea.objects.order_by("-created"))
+        self.assertEqual([idea.pk for idea in merged], expected)
+
+        result, _, _ = self.execute("{ publicIdeas { id } }")
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [int(idea["id"]) for idea in result.data["publicIdeas"]], expected
+        )
+
+        viewer = self.create_user()
+        self.first.followers.add(viewer)
+        self.second.followers.add(viewer)
+        result, _, _ = self.execute("{ timeline { id } }", viewer.user)
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [int(idea["id"]) for idea in result.data["timeline"]], expected
+        )
+
+    def test_deleted_profile(self):
+        """
+        The ideas of a deleted Profile are hidden in every shard
+        """
+        for profile in (self.first, self.second):
+            self.create_ideas(profile, 2)
+        self.assertEqual(self.count_ideas(), 4)
+        request_account_deletion(self.second.user)
+        for shard in self.shards:
+            self.assertTrue(
+                DeletedProfile.objects.using(shard)
+                .filter(profile_id=self.second.pk)
+                .exists()
+            )
+        self.assertEqual(self.count_ideas(), 2)
+        self.assertEqual(self.count_ideas(profile=self.first), 2)
@@ -0,0 +1,188 @@
+"""
+Admission control of the GraphQL requests: token bucket rate limits per client and
+root field, and concurrency limits (with a bounded wait queue) per operation type.
+Everything is kept in process memory, so the limits apply per worker process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from graphql.error.base import GraphQLError
+
+
+class AdmissionError(GraphQLError):
+    """
+    GraphQLError raised when a request is shed. The `extensions` carry a machine
+    readable code and the seconds after which the client may retry
+    """
+
+    status_code = 429
+
+    def __init__(self, message, code, retry_after):
+        super().__init__(
+            message, extensions={"code": code, "retryAfter": round(retry_after, 3)}
+        )
+
+
+class RateLimitedError(AdmissionError):
+    def __init__(self, operation, retry_after):
+        super().__init__(
+            f"Too many {operation} requests, slow down",
+            code="RATE_LIMITED",
+            retry_after=retry_after,
+        )
+
+
+class OverloadedError(AdmissionError):
+    status_code = 503
+
+    def __init__(self, operation_type, retry_after):
+        super().__init__(
+            f"The server is overloaded and can't take more {operation_type} requests",
+            code="OVERLOADED",
+            retry_after=retry_after,
+        )
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second with bursts of up to `capacity` requests
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self):
+        """
+        Takes a token from the bucket. Returns 0 if there was one available or the
+        seconds until the next one otherwise
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Token buckets per key. The least recently used buckets are dropped when there
+    are more than max_keys (a dropped bucket starts full again)
+    """
+
+    def __init__(self, limits, max_keys=100000):
+        """
+        limits is a dict of operation name: (rate per second, burst). The "default"
+        entry applies to the operations without an entry of their own
+        """
+        self.limits = limits
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def check(self, client, operation):
+        """
+        Raises RateLimitedError if client has exhausted its rate of operation
+        """
+        limit = self.limits.get(operation, self.limits.get("default"))
+        if limit is None:
+            return
+        key = (client, operation)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(*limit)
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            retry_after = bucket.consume()
+        if retry_after:
+            raise RateLimitedError(operation, retry_after)
+
+
+class ConcurrencyLimiter:
+    """
+    Allows up to max_concurrent requests at the same time. Up to max_waiting more
+    requests wait (at most `timeout` seconds) for a free slot, the rest are shed
+    """
+
+    def __init__(self, name, max_concurrent, max_waiting, timeout):
+        self.name = name
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        # Requests holding a slot, waiting for one and shed so far
+        self.running = 0
+        self.waiting = 0
+        self.shed = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds a slot while the block runs. Raises OverloadedError if it can't
+        """
+        if not self.semaphore.acquire(blocking=False):
+            with self.lock:
+                if self.waiting >= self.max_waiting:
+                    self.shed += 1
+                    raise OverloadedError(self.name, self.timeout)
+                self.waiting += 1
+            try:
+                acquired = self.semaphore.acquire(timeout=self.timeout)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self.lock:
+                    self.shed += 1
+                raise OverloadedError(self.name, self.timeout)
+        with self.lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.semaphore.release()
+
+
+def get_client_key(request):
+    """
+    Returns the key identifying the client of a request to rate limit it: its user
+    if it's logged in or its IP address otherwise
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter():
+    """
+    Returns the RateLimiter of this process, configured by GRAPHQL_RATE_LIMITS
+    """
+    return RateLimiter(settings.GRAPHQL_RATE_LIMITS)
+
+
+@lru_cache(maxsize=None)
+def get_concurrency_limiter(operation_type):
+    """
+    Returns the ConcurrencyLimiter of this process for the operation type (query or
+    mutation), configured by GRAPHQL_CONCURRENCY_LIMITS
+    """
+    return ConcurrencyLimiter(
+        operation_type, **settings.GRAPHQL_CONCURRENCY_LIMITS[operation_type]
+    )
@@ -17,10 +17,11 @@ from django.contrib import admin
 from django.urls import path
 
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from ideary.views import IdearyGraphQLView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
-    # path("graphql/", GraphQLView.as_view(graphiql=True)),
+    path("graphql/", csrf_exempt(IdearyGraphQLView.as_view(graphiql=True))),
+    # path("graphql/", IdearyGraphQLView.as_view(graphiql=True)),
 ]
@@ -0,0 +1,260 @@
+import math
+from contextlib import nullcontext
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.views import GraphQLView, HttpError
+from graphql import graphql
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult
+from graphql.language import ast
+from graphql.language.parser import parse
+
+from ideary.budgets import execute_within_budget, get_root_fields
+from ideary.profiling import profile_execution, should_profile
+from ideary.renderers import dumps, dumps_pretty, iter_response, should_stream
+from ideary.throttling import AdmissionError, OverloadedError, get_concurrency_limiter
+
+
+@lru_cache(maxsize=128)
+def is_introspection_query(query):
+    """
+    Returns True if every root field of every operation of the query is an
+    introspection one (__schema, __type or __typename). Fragments are only used
+    from those fields, so they are introspection ones as well
+    """
+    if "__schema" not in query and "__type" not in query:
+        return False
+    try:
+        document = parse(query)
+    except Exception:
+        return False
+    operations = [
+        definition
+        for definition in document.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    ]
+    for definition in operations:
+        for selection in definition.selection_set.selections:
+            if not isinstance(selection, ast.Field):
+                return False
+            if not selection.name.value.startswith("__"):
+                return False
+    return bool(operations)
+
+
+@lru_cache(maxsize=32)
+def get_introspection_result(schema, query, operation_name):
+    """
+    Executes (once per schema, query and operation) an introspection query
+    """
+    return graphql(schema, query, operation_name=operation_name)
+
+
+def get_retry_after(response):
+    """
+    Returns the seconds (rounded up) after which the client may retry a request shed
+    by the admission control, as the Retry-After header requires an integer. None if
+    the response has no admission error
+    """
+    retry_after = [
+        error["extensions"]["retryAfter"]
+        for error in response.get("errors") or []
+        if "retryAfter" in (error.get("extensions") or {})
+    ]
+    if not retry_after:
+        return None
+    return max(1, math.ceil(max(retry_after)))
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """
+    GraphQLCoreBackend that keeps the last `maxsize` parsed documents, so the same
+    query is parsed once instead of once per request
+    """
+
+    def __init__(self, maxsize=256):
+        super().__init__()
+        self.document_from_string = lru_cache(maxsize=maxsize)(
+            self.document_from_string
+        )
+
+
+document_backend = CachedDocumentBackend()
+
+
+class IdearyGraphQLView(GraphQLView):
+    """
+    GraphQLView that:
+    - Caches the results of the introspection queries, as they only depend on the
+      schema (which doesn't change while the process lives)
+    - Encodes the responses with the fast JSON encoder of ideary.renderers and
+      streams the responses with big top level lists (see
+      GRAPHQL_STREAM_LIST_THRESHOLD) instead of building them as a single string
+    - Limits the queries and mutations executed at the same time (see
+      GRAPHQL_CONCURRENCY_LIMITS), shedding the requests that can't be admitted.
+      The shed requests get the status of their AdmissionError (429 or 503) and a
+      Retry-After header
+    - Profiles the execution of the requests asking for it (see ideary.profiling)
+    - Logs the operations exceeding the budgets of their root fields (see
+      ideary.budgets)
+    """
+
+    def __init__(self, *args, backend=None, **kwargs):
+        super().__init__(*args, backend=backend or document_backend, **kwargs)
+
+    @method_decorator(ensure_csrf_cookie)
+    def dispatch(self, request, *args, **kwargs):
+        if self.batch or request.method.lower() not in ("get", "post"):
+            return super().dispatch(request, *args, **kwargs)
+
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return super().dispatch(request, *args, **kwargs)
+            response, status_code = self.get_response_dict(request, data)
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+        threshold = settings.GRAPHQL_STREAM_LIST_THRESHOLD
+        pretty = self.pretty or request.GET.get("pretty")
+        if threshold is not None and not pretty and should_stream(response, threshold):
+            http_response = StreamingHttpResponse(
+                iter_response(response, threshold, settings.GRAPHQL_STREAM_CHUNK_SIZE),
+                status=status_code,
+                content_type="application/json",
+            )
+        else:
+            http_response = HttpResponse(
+                status=status_code,
+                content=self.encode(request, response),
+                content_type="application/json",
+            )
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            http_response["Retry-After"] = retry_after
+        return http_response
+
+    def get_response(self, request, data, show_graphiql=False):
+        response, status_code = self.get_response_dict(request, data, show_graphiql)
+        if response is None:
+            return None, status_code
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def get_response_dict(self, request, data, show_graphiql=False):
+        """
+        Same as GraphQLView.get_response but returning the response before encoding
+        it as JSON
+        """
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        status_code = 200
+        if not execution_result:
+            return None, status_code
+
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        for error in execution_result.errors or []:
+            # The errors raised by the resolvers are wrapped in GraphQLLocatedError
+            error = getattr(error, "original_error", error)
+            if isinstance(error, AdmissionError):
+                status_code = error.status_code
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return response, status_code
+
+    def encode(self, request, d, pretty=False):
+        """
+        Encodes d as JSON bytes
+        """
+        if not (self.pretty or pretty) and not request.GET.get("pretty"):
+            return dumps(d)
+        return dumps_pretty(d)
+
+    def json_encode(self, request, d, pretty=False):
+        return self.encode(request, d, pretty).decode()
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if query and not variables and is_introspection_query(query):
+            return get_introspection_result(self.schema, query, operation_name)
+
+        operation_type, name = self.get_operation(request, query, operation_name)
+        execute = partial(
+            super().execute_graphql_request,
+            request,
+            data,
+            query,
+            variables,
+            operation_name,
+            show_graphiql,
+        )
+        label = name or f"anonymous_{operation_type}"
+        try:
+            with self.admit(operation_type):
+                if should_profile(request):
+                    with profile_execution(label):
+                        return execute()
+                # The documents that can't be parsed have no operation type
+                if settings.GRAPHQL_LOG_BUDGET_VIOLATIONS and operation_type:
+                    document = self.get_document(request, query).document_ast
+                    fields = get_root_fields(document, name)
+                    return execute_within_budget(execute, fields, label)
+                return execute()
+        except OverloadedError as e:
+            return ExecutionResult(errors=[e])
+
+    def admit(self, operation_type):
+        """
+        Returns the context manager that holds a slot of the concurrency limiter of
+        the operation type while the operation is executed
+        """
+        if operation_type not in settings.GRAPHQL_CONCURRENCY_LIMITS:
+            return nullcontext()
+        return get_concurrency_limiter(operation_type).slot()
+
+    def get_operation(self, request, query, operation_name):
+        """
+        Returns the type (query, mutation...) and the name of the operation to
+        execute. They are None if they can't be determined (errors are reported
+        later by the execution) and the name is None for anonymous operations
+        """
+        if not query:
+            return None, None
+        try:
+            document = self.get_document(request, query)
+        except Exception:
+            return None, None
+        operations = document.operations_map
+        if not operation_name and len(operations) == 1:
+            operation_name = next(iter(operations))
+        return operations.get(operation_name), operation_name
+
+    def get_document(self, request, query):
+        """
+        Returns the parsed document of query (see CachedDocumentBackend)
+        """
+        return self.get_backend(request).document_from_string(self.schema, query)
@@ -0,0 +1,185 @@
+"""
+Cache warming, so the first requests after a deploy (or a cache flush) don't all miss
+at once. Warming a Profile loads into the identity cache the entries every request of
+its User needs (its Profile id and Profile) and reads the first page of its timeline
+in every shard, and warming the ideas of a Profile reads the first page of its
+profile ideas (as seen by anonymous viewers). The pages are the first rows of the
+querysets of the resolvers, so the rows and partitions they read first are in the
+Postgres buffers. There is no result cache, so only a bounded page is read.
+
+Every login warms its Profile in background, inside the web worker serving it (see
+CACHE_WARMING in settings.py). The `warm_caches` command warms the recently active
+Profiles and the ideas of the most followed ones from its own process: it only warms
+the identity cache when that cache is shared between processes (see
+is_shared_cache), the database otherwise. The warming tasks run in a WarmingPool: a
+bounded pool of threads throttled to a rate of tasks per second, so warming never
+competes with the requests for the database.
+"""
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from ideary.identity_cache import get_cached_object
+from ideary.sharding import get_shards, scatter
+from ideary.throttling import TokenBucket
+from ideas.ideas_services import get_timeline, get_visible_ideas
+from profiles.models import Profile, is_deleted_profile
+from profiles.profiles_services import get_profile_id
+
+logger = logging.getLogger(__name__)
+
+
+def is_shared_cache(cache):
+    """
+    Returns whether the entries of a cache are seen by every process (i.e. it's not
+    a local memory or dummy cache)
+    """
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def warm_profile(profile_id, page_size, cache=True):
+    """
+    Warms the first `page_size` ideas of the timeline of a Profile in every shard
+    (of the queryset of resolve_timeline) and, if cache, the identity cache entries
+    of the requests of its User
+    """
+    if cache:
+        profile = get_cached_object(Profile, profile_id)
+        get_profile_id(profile.user)
+    for shard in get_shards():
+        list(get_timeline(profile_id).using(shard)[:page_size])
+
+
+def warm_profile_ideas(profile_id, page_size):
+    """
+    Warms the first `page_size` profile ideas of a Profile as seen by anonymous
+    viewers (of the queryset of resolve_profile_ideas)
+    """
+    profile = Profile.objects.active().get(pk=profile_id)
+    list(get_visible_ideas(profile)[:page_size])
+
+
+def get_active_profile_ids(days):
+    """
+    Returns the ids of the Profiles whose User has logged in the last `days`, the
+    most recent first
+    """
+    since = timezone.now() - timedelta(days=days)
+    return list(
+        Profile.objects.active()
+        .filter(user__last_login__gte=since)
+        .order_by("-user__last_login")
+        .values_list("pk", flat=True)
+    )
+
+
+def get_popular_profile_ids(count):
+    """
+    Returns the ids of the `count` Profiles with more followers, the most followed
+    first. The follower edges of a Profile live in its shard, so the top of every
+    shard is merged
+    """
+    followers = (
+        Profile.followers.through.objects.exclude(is_deleted_profile("from_profile_id"))
+        .values("from_profile_id")
+        .annotate(followers=Count("to_profile_id"))
+        .order_by("-followers")
+        .values_list("from_profile_id", "followers")
+    )
+    top = heapq.nlargest(count, scatter(followers[:count]), key=itemgetter(1))
+    return [profile_id for profile_id, _ in top]
+
+
+class WarmingPool:
+    """
+    Pool of `workers` threads running warming tasks, started at no more than `rate`
+    per second. Up to max_pending more tasks wait for a free thread
+    """
+
+    def __init__(self, workers, max_pending, rate):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="warming")
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.bucket = TokenBucket(rate, capacity=workers)
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def submit(self, function, *args, block=False):
+        """
+        Queues function(*args). When the pool is full it waits for room if block,
+        otherwise the task is dropped. Returns whether it was queued
+        """
+        if not self.slots.acquire(blocking=block):
+            with self.lock:
+                self.dropped += 1
+            return False
+        self.executor.submit(self._run, function, *args)
+        return True
+
+    def _throttle(self):
+        while True:
+            with self.lock:
+                wait = self.bucket.consume()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _run(self, function, *args):
+        try:
+            self._throttle()
+            function(*args)
+        except Exception:
+            logger.exception("Warming task %s%s failed", function.__name__, args)
+            with self.lock:
+                self.failed += 1
+        else:
+            with self.lock:
+                self.completed += 1
+        finally:
+            # Long lived threads: their connections are closed as in a request
+            close_old_connections()
+            self.slots.release()
+
+    def join(self):
+        """
+        Waits for the queued tasks to finish
+        """
+        self.executor.shutdown(wait=True)
+
+
+@lru_cache(maxsize=None)
+def get_login_warming_pool():
+    """
+    Returns the WarmingPool of the logins of this process, None if its
+    `login_workers` are 0 (no warming on login)
+    """
+    config = settings.CACHE_WARMING
+    if not config["login_workers"]:
+        return None
+    return WarmingPool(
+        config["login_workers"], config["login_max_pending"], config["login_rate"]
+    )
+
+
+def warm_on_login(user):
+    """
+    Warms the Profile of a User that has just logged in, in background. Dropped if
+    the login warming pool is full
+    """
+    pool = get_login_warming_pool()
+    profile_id = get_profile_id(user)
+    if pool is not None and profile_id is not None:
+        pool.submit(warm_profile, profile_id, settings.CACHE_WARMING["page_size"])
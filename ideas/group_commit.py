@@ -0,0 +1,178 @@
+"""
+Group commit of the Ideas created concurrently (see IDEAS_GROUP_COMMIT in
+settings.py). The first idea of a window becomes the leader: it waits up to `window`
+seconds (or until `max_batch` ideas are queued) and writes the whole batch with a
+multi-row INSERT and a single commit per shard, so a burst of CreateIdea mutations
+pays one commit per batch instead of one per idea. Every caller still gets its own
+Idea (with its id) or its own error: when a batch fails its ideas are inserted one by
+one. The callers whose batch isn't taken by its leader within `timeout` seconds after
+the window get an OverloadedError, and their Idea is not created; the ones already in
+a batch being written wait for its outcome, so a retry never duplicates an Idea. Once
+released, every caller sends the post_save signals (the notifications) of its own
+Idea: their failures are logged, they don't fail the caller.
+
+Every Idea of a batch holds a slot of the mutation concurrency limiter while it
+waits, so a batch never has more Ideas than
+GRAPHQL_CONCURRENCY_LIMITS["mutation"]["max_concurrent"], and max_batch is capped to
+it (otherwise the leader would always wait the whole window).
+"""
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.signals import post_save
+
+from ideary.throttling import OverloadedError
+
+from .models import Idea
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("idea", "done", "error", "using")
+
+    def __init__(self, idea):
+        self.idea = idea
+        self.done = threading.Event()
+        self.error = None
+        self.using = None
+
+
+class GroupCommitQueue:
+    """
+    Queue coalescing the Ideas created within `window` seconds (up to max_batch) into
+    a single INSERT and commit. The callers wait up to `timeout` more seconds for
+    their batch to be written
+    """
+
+    def __init__(self, window, max_batch, timeout):
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.pending = []
+        self.batches = 0
+
+    def create(self, idea):
+        """
+        Inserts a new Idea along with the ones created concurrently. Returns it with
+        its id once committed, or raises the error of its INSERT (OverloadedError if
+        its batch isn't taken in time, the Idea isn't created then)
+        """
+        entry = _Entry(idea)
+        with self.condition:
+            batch = self.pending
+            batch.append(entry)
+            leader = len(batch) == 1
+            if len(batch) >= self.max_batch:
+                # Detached right away, so no other Idea joins the full batch
+                self.pending = []
+                self.condition.notify_all()
+            if leader:
+                self.condition.wait_for(
+                    lambda: self.pending is not batch, timeout=self.window
+                )
+                if self.pending is batch:
+                    self.pending = []
+        if leader:
+            self.write(batch)
+        elif not entry.done.wait(self.window + self.timeout):
+            with self.condition:
+                taken = self.pending is not batch
+                if not taken:
+                    batch.remove(entry)
+            if not taken:
+                logger.error(
+                    "Group commit of an Idea of Profile %s timed out", idea.profile_id
+                )
+                raise OverloadedError("idea creation", self.timeout)
+            # Its batch is being written: its outcome is the one of the INSERT
+            entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        self.send_post_save(entry.using, idea)
+        return idea
+
+    def write(self, batch):
+        """
+        Inserts a batch in the shards of its Ideas and releases its callers. They are
+        always released, with the unexpected errors (e.g. of the router) if their
+        Ideas couldn't be inserted
+        """
+        shards = {}
+        try:
+            for entry in batch:
+                entry.using = router.db_for_write(Idea, instance=entry.idea)
+                shards.setdefault(entry.using, []).append(entry)
+            for using, entries in shards.items():
+                self.insert(using, entries)
+            with self.condition:
+                self.batches += 1
+        except Exception as error:
+            logger.exception("Group commit of %s Ideas failed", len(batch))
+            for entry in batch:
+                if entry.error is None and entry.idea.pk is None:
+                    entry.error = error
+        finally:
+            for entry in batch:
+                entry.done.set()
+
+    def insert(self, using, entries):
+        """
+        Inserts the Ideas of entries in the `using` database with a single statement
+        (and commit). If it fails they are inserted one by one, so only the faulty
+        ones get the error
+        """
+        try:
+            with transaction.atomic(using=using):
+                Idea.objects.using(using).bulk_create(entry.idea for entry in entries)
+            return
+        except Exception as error:
+            if len(entries) == 1:
+                entries[0].error = error
+                return
+        for entry in entries:
+            try:
+                with transaction.atomic(using=using):
+                    Idea.objects.using(using).bulk_create([entry.idea])
+            except Exception as error:
+                entry.error = error
+
+    def send_post_save(self, using, idea):
+        responses = post_save.send_robust(
+            sender=Idea,
+            instance=idea,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=using,
+        )
+        for receiver, response in responses:
+            if isinstance(response, Exception):
+                logger.error(
+                    "post_save receiver %s failed for Idea %s: %r",
+                    receiver.__name__,
+                    idea.pk,
+                    response,
+                )
+
+
+@lru_cache(maxsize=None)
+def get_group_commit_queue():
+    """
+    Returns the GroupCommitQueue of this process, None if its window is 0 (every
+    Idea inserted on its own). Its max_batch is capped to the mutations executed at
+    the same time (see the module docstring)
+    """
+    config = dict(settings.IDEAS_GROUP_COMMIT)
+    if not config["window"]:
+        return None
+    mutation_limits = settings.GRAPHQL_CONCURRENCY_LIMITS.get("mutation")
+    if mutation_limits is not None:
+        config["max_batch"] = min(
+            config["max_batch"], mutation_limits["max_concurrent"]
+        )
+    return GroupCommitQueue(**config)
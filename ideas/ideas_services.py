@@ -1,20 +1,57 @@
+from django.db import connections, router
+
+from ideary.sharding import get_shard
+
+from .group_commit import get_group_commit_queue
 from .models import Idea
+from .visibility import filter_visible, in_timeline_of
 
 
-def get_visible_ideas(ideas_profile, consulting_profile=None):
+def get_visible_ideas(ideas_profile, viewer_id=None, since=None):
     """
-    Returns a queryset of all the visible ideas of ideas_profile (Profile) by
-    another consulting_profile (Profile). If no consulting_profile is provided
-    then it will only return the PUBLIC ones
+    Returns a queryset of all the ideas of ideas_profile (Profile) visible by the
+    viewer (Profile id, see ideas.visibility). If no viewer_id is provided then it
+    will only return the PUBLIC ones
+    If since (datetime) is provided only the ideas created from then are returned
+    The ideas are read from the shard of ideas_profile
     """
-    visibilities_accepted = [Idea.PUBLIC]
-    if consulting_profile:
-        if consulting_profile in ideas_profile.get_followers():
-            visibilities_accepted.append(Idea.PROTECTED)
-        if consulting_profile == ideas_profile:
-            # Same case as "my_ideas". Weird, but can happen.
-            visibilities_accepted.append(Idea.PRIVATE)
+    ideas = Idea.objects.using(get_shard(ideas_profile.pk)).filter(
+        profile=ideas_profile
+    )
+    ideas = filter_visible(ideas, viewer_id)
+    return filter_since(ideas, since).order_by("-created")
+
+
+def get_timeline(viewer_id, since=None):
+    """
+    Returns a queryset of the timeline of the viewer (Profile id, see
+    ideas.visibility.in_timeline_of) ordered by descending date, optionally limited
+    to the ideas created from since (datetime). It must be run in every shard
+    """
+    timeline = Idea.objects.active().filter(in_timeline_of(viewer_id))
+    return filter_since(timeline, since).order_by("-created")
+
 
-    return Idea.objects.filter(
-        profile=ideas_profile, visibility__in=visibilities_accepted
-    ).order_by("-created")
+def filter_since(ideas, since=None):
+    """
+    Limits an Idea queryset to the ideas created from since (datetime), if provided.
+    Bounding by `created` lets Postgres prune the monthly partitions out of range;
+    without since every partition is scanned
+    """
+    if since is None:
+        return ideas
+    return ideas.filter(created__gte=since)
+
+
+def create_idea(idea):
+    """
+    Inserts a new Idea (in the shard of its Profile). When IDEAS_GROUP_COMMIT is on,
+    it's written along with the Ideas created concurrently (see ideas.group_commit),
+    unless it's created within a transaction, whose rollback must undo it
+    """
+    queue = get_group_commit_queue()
+    using = router.db_for_write(Idea, instance=idea)
+    if queue is None or connections[using].in_atomic_block:
+        idea.save(using=using)
+        return idea
+    return queue.create(idea)
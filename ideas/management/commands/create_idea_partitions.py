@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from ideary.sharding import get_shards
+from ideas.partitioning import ensure_partitions, is_partitioned, move_cold_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the upcoming monthly partitions of the Idea table and moves the old "
+        "ones to the cold tablespace, in every shard. Meant to be run periodically "
+        "(e.g. daily cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.IDEAS_PARTITION_MONTHS_AHEAD,
+            help="Number of future months to have partitions for",
+        )
+        parser.add_argument(
+            "--cold-tablespace",
+            default=settings.IDEAS_COLD_TABLESPACE,
+            help="Tablespace where the partitions out of the hot window are moved",
+        )
+        parser.add_argument(
+            "--hot-months",
+            type=int,
+            default=settings.IDEAS_HOT_MONTHS,
+            help="Number of recent months kept in the default tablespace",
+        )
+
+    def handle(self, *args, **options):
+        for shard in get_shards():
+            self.update_partitions(connections[shard], options)
+        self.stdout.write(self.style.SUCCESS("Idea partitions are up to date"))
+
+    def update_partitions(self, connection, options):
+        if not is_partitioned(connection):
+            raise CommandError(
+                f"The Idea table is not partitioned in the {connection.alias} database"
+            )
+
+        with transaction.atomic(using=connection.alias):
+            created = ensure_partitions(
+                connection, datetime.now(timezone.utc), options["months_ahead"]
+            )
+        for name in created:
+            self.stdout.write(f"Created partition {name} in {connection.alias}")
+
+        if options["cold_tablespace"]:
+            moved = move_cold_partitions(
+                connection, options["cold_tablespace"], options["hot_months"]
+            )
+            for name in moved:
+                self.stdout.write(
+                    f"Moved partition {name} of {connection.alias} to "
+                    f"{options['cold_tablespace']}"
+                )
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations
+
+from ideas.partitioning import DEFAULT_PARTITION, IDEA_TABLE, ensure_partitions
+
+LEGACY_TABLE = f"{IDEA_TABLE}_unpartitioned"
+
+
+def partition_idea_table(apps, schema_editor):
+    """
+    Converts the Idea table into a table partitioned by RANGE (created) with one
+    partition per month, moving the existing rows to their partitions
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {IDEA_TABLE} RENAME TO {LEGACY_TABLE}")
+        cursor.execute(f"ALTER INDEX {IDEA_TABLE}_pkey RENAME TO {LEGACY_TABLE}_pkey")
+        cursor.execute(
+            f"""
+            CREATE TABLE {IDEA_TABLE} (
+                LIKE {LEGACY_TABLE} INCLUDING DEFAULTS
+            ) PARTITION BY RANGE (created)
+            """
+        )
+        # The partition key must be part of the primary key
+        cursor.execute(f"ALTER TABLE {IDEA_TABLE} ADD PRIMARY KEY (id, created)")
+        cursor.execute(
+            f"""
+            ALTER TABLE {IDEA_TABLE}
+            ADD CONSTRAINT {IDEA_TABLE}_profile_id_fk_profiles_profile_id
+            FOREIGN KEY (profile_id) REFERENCES profiles_profile (id)
+            DEFERRABLE INITIALLY DEFERRED
+            """
+        )
+        cursor.execute(
+            f"CREATE INDEX {IDEA_TABLE}_profile_created "
+            f"ON {IDEA_TABLE} (profile_id, created DESC)"
+        )
+        cursor.execute(
+            f"CREATE INDEX {IDEA_TABLE}_created ON {IDEA_TABLE} (created DESC)"
+        )
+        cursor.execute(
+            f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {IDEA_TABLE} DEFAULT"
+        )
+        cursor.execute(f"SELECT MIN(created) FROM {LEGACY_TABLE}")
+        oldest = cursor.fetchone()[0] or datetime.now(timezone.utc)
+
+    ensure_partitions(connection, oldest, settings.IDEAS_PARTITION_MONTHS_AHEAD)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {IDEA_TABLE} SELECT * FROM {LEGACY_TABLE}")
+        cursor.execute(f"ALTER SEQUENCE {IDEA_TABLE}_id_seq OWNED BY {IDEA_TABLE}.id")
+        cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+
+
+def unpartition_idea_table(apps, schema_editor):
+    """
+    Converts back the partitioned Idea table into a regular table
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {IDEA_TABLE} RENAME TO {LEGACY_TABLE}")
+        cursor.execute(f"ALTER INDEX {IDEA_TABLE}_pkey RENAME TO {LEGACY_TABLE}_pkey")
+        cursor.execute(
+            f"""
+            CREATE TABLE {IDEA_TABLE} (
+                LIKE {LEGACY_TABLE} INCLUDING DEFAULTS,
+                PRIMARY KEY (id)
+            )
+            """
+        )
+        cursor.execute(
+            f"""
+            ALTER TABLE {IDEA_TABLE}
+            ADD CONSTRAINT {IDEA_TABLE}_profile_id_fk_profiles_profile_id
+            FOREIGN KEY (profile_id) REFERENCES profiles_profile (id)
+            DEFERRABLE INITIALLY DEFERRED
+            """
+        )
+        cursor.execute(
+            f"CREATE INDEX {IDEA_TABLE}_profile_id ON {IDEA_TABLE} (profile_id)"
+        )
+        cursor.execute(f"INSERT INTO {IDEA_TABLE} SELECT * FROM {LEGACY_TABLE}")
+        cursor.execute(f"ALTER SEQUENCE {IDEA_TABLE}_id_seq OWNED BY {IDEA_TABLE}.id")
+        cursor.execute(f"DROP TABLE {LEGACY_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ideas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_idea_table, unpartition_idea_table),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.0.5 on 2026-10-19 16:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0006_remove_profile_db_constraints'),
+        ('ideas', '0002_partition_idea_by_created'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='idea',
+            name='profile',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='profiles.Profile'),
+        ),
+    ]
@@ -1,10 +1,19 @@
-from django.db import models
+from django.db import connections, models
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_migrate, post_save
 from django.dispatch import receiver
+from ideary.sharding import set_id_range
 from mailing.views import send_new_idea_mail
 
-from profiles.models import Profile
+from profiles.models import Profile, is_deleted_profile
+
+
+class IdeaQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Excludes the Ideas of the Profiles whose account deletion has been requested
+        """
+        return self.exclude(is_deleted_profile("profile_id"))
 
 
 class Idea(models.Model):
@@ -19,13 +28,16 @@ class Idea(models.Model):
         (PRIVATE, "Private"),
     ]
 
-    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    # Without a database constraint, as the Ideas live in the shard of their Profile
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, db_constraint=False)
     content = models.CharField(max_length=500, blank=False, null=False)
     visibility = models.CharField(
         max_length=3, choices=VISIBILITY_OPTIONS, default=PUBLIC
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = IdeaQuerySet.as_manager()
+
 
 @receiver(post_save, sender=Idea)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -34,3 +46,12 @@ def create_user_profile(sender, instance, created, **kwargs):
     """
     if created and instance.visibility in [Idea.PUBLIC, Idea.PROTECTED]:
         send_new_idea_mail(instance)
+
+
+@receiver(post_migrate)
+def set_idea_id_range(sender, using, **kwargs):
+    """
+    Signal to make the Idea ids of a shard unique across the shards, after migrating it
+    """
+    if sender.label == "ideas":
+        set_id_range(connections[using], Idea._meta.db_table)
@@ -0,0 +1,158 @@
+"""
+Helpers to manage the monthly range partitions of the Idea table (by `created`).
+
+The table is partitioned natively by Postgres (see migration 0002), so every month
+lives in its own `ideas_idea_YYYYMM` partition. Feed queries bounded by `created`
+(the `since` argument of timeline and profileIdeas) only touch the recent (hot)
+partitions and old ones can be moved to a cold tablespace without affecting the hot
+working set. The feeds requested without `since` are not bounded, so they still scan
+(the indexes of) every partition.
+"""
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+IDEA_TABLE = "ideas_idea"
+DEFAULT_PARTITION = f"{IDEA_TABLE}_default"
+
+
+def month_start(value):
+    """
+    Returns the first instant (UTC) of the month of the given datetime
+    """
+    value = value.astimezone(timezone.utc) if value.tzinfo else value
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, months):
+    """
+    Returns the first instant of the month `months` away from the given month start
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month):
+    """
+    Returns the name of the partition holding the ideas created in the given month
+    """
+    return f"{IDEA_TABLE}_{month:%Y%m}"
+
+
+def is_partitioned(connection):
+    """
+    Returns True if the Idea table is a partitioned table in the given connection
+    """
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [IDEA_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(connection):
+    """
+    Returns the list of (name, tablespace) of the monthly partitions of the Idea
+    table ordered by month. The DEFAULT partition is not included.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, COALESCE(ts.spcname, '')
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            LEFT JOIN pg_tablespace ts ON ts.oid = child.reltablespace
+            WHERE parent.relname = %s AND child.relname <> %s
+            ORDER BY child.relname
+            """,
+            [IDEA_TABLE, DEFAULT_PARTITION],
+        )
+        return cursor.fetchall()
+
+
+def create_partition(connection, month):
+    """
+    Creates (if it does not exist yet) the partition for the given month. The ideas
+    of that month already in the DEFAULT partition (created while the partition was
+    missing, e.g. when the cron job missed its window) are moved to it.
+    Returns True if the partition has been created
+    """
+    name = partition_name(month)
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+            "WHERE created >= %s AND created < %s)",
+            bounds,
+        )
+        misplaced = cursor.fetchone()[0]
+        # Postgres refuses to create a partition for rows of the DEFAULT partition,
+        # so it's detached while they are moved
+        if misplaced:
+            cursor.execute(
+                f"ALTER TABLE {IDEA_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"
+            )
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {IDEA_TABLE} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        if misplaced:
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION}
+                    WHERE created >= %s AND created < %s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """,
+                bounds,
+            )
+            cursor.execute(
+                f"ALTER TABLE {IDEA_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+            )
+    return True
+
+
+def ensure_partitions(connection, start, months_ahead, now=None):
+    """
+    Creates every missing monthly partition from the month of `start` to
+    `months_ahead` months after the current one. Returns the names of the created
+    partitions
+    """
+    now = now or datetime.now(timezone.utc)
+    month = month_start(start)
+    last = add_months(month_start(now), months_ahead)
+    created = []
+    while month <= last:
+        if create_partition(connection, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def move_cold_partitions(connection, tablespace, hot_months, now=None):
+    """
+    Moves to `tablespace` every partition older than the last `hot_months` months.
+    Returns the names of the moved partitions
+    """
+    now = now or datetime.now(timezone.utc)
+    oldest_hot = partition_name(add_months(month_start(now), -hot_months + 1))
+    moved = []
+    for name, current_tablespace in get_partitions(connection):
+        if name < oldest_hot and current_tablespace != tablespace:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"ALTER TABLE {name} SET TABLESPACE "
+                    f"{connection.ops.quote_name(tablespace)}"
+                )
+            moved.append(name)
+    return moved
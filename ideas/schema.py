@@ -1,16 +1,26 @@
 import graphene
 from graphene_django import DjangoObjectType
 from graphql.error.base import GraphQLError
-from ideas.ideas_services import get_visible_ideas
+from ideas.ideas_services import create_idea, get_timeline, get_visible_ideas
+from ideas.visibility import filter_visible
+from ideary.projection import ProjectableType, project
+from ideary.sharding import gather, get_by_id
 from profiles.models import Profile
 from profiles.permisision_tools import check_permission_user_idea
+from profiles.profiles_services import get_profile_id, get_user_profile
 
 from .models import Idea
 
 from graphql_jwt.decorators import login_required
 
 
-class IdeaType(DjangoObjectType):
+SINCE = (
+    "Only the ideas created from then. It limits the monthly partitions of the ideas "
+    "read, so the clients should pass it whenever they can"
+)
+
+
+class IdeaType(ProjectableType, DjangoObjectType):
     class Meta:
         model = Idea
 
@@ -19,23 +29,29 @@ class Query(graphene.ObjectType):
     ideas = graphene.List(IdeaType)
     public_ideas = graphene.List(IdeaType)
     my_ideas = graphene.List(IdeaType)
-    timeline = graphene.List(IdeaType)
-    profile_ideas = graphene.List(IdeaType, user_id=graphene.Int())
+    timeline = graphene.List(IdeaType, since=graphene.DateTime(description=SINCE))
+    profile_ideas = graphene.List(
+        IdeaType, user_id=graphene.Int(), since=graphene.DateTime(description=SINCE)
+    )
 
     def resolve_ideas(self, info, **kwargs):
         """
-        List all the visible Ideas
+        List all the Ideas visible to the user in the request: the PUBLIC ones, the
+        PROTECTED of the Profiles they follow and their own ones (ordered by
+        descending date)
         """
-        # TODO(alealvpav): Default queryset should be limited to PUBLIC. Then add the
-        # PRIVATE own ideas and the PROTECTED of the following profiles
-        return Idea.objects.all()
+        user = info.context.user
+        viewer_id = get_profile_id(user) if user.is_authenticated else None
+        ideas = filter_visible(Idea.objects.active(), viewer_id).order_by("-created")
+        return gather(project(ideas, info))
 
     def resolve_public_ideas(self, info, **kwargs):
         """
         List the PUBLIC (visibility) Ideas
         This functionality is covered by resolve_ideas but it's here for testing purposes
         """
-        return Idea.objects.filter(visibility=Idea.PUBLIC)
+        ideas = filter_visible(Idea.objects.active()).order_by("-created")
+        return gather(project(ideas, info))
 
     @login_required
     def resolve_my_ideas(self, info, **kwargs):
@@ -43,37 +59,35 @@ class Query(graphene.ObjectType):
         List the Ideas published by a user
         """
         user = info.context.user
-        return user.profile.get_my_ideas()
+        return project(get_user_profile(user).get_my_ideas(), info)
 
     @login_required
-    def resolve_timeline(self, info, **kwargs):
+    def resolve_timeline(self, info, since=None, **kwargs):
         """
         List the timeline (Ideas) of a logged User. This means all the ideas of the
         logged user and the PUBLIC and PROTECTED of the Profiles he follows (ordered by descending date).
+        Optionally limited to the ideas created from `since`.
         - Un usuario puede ver un timeline de ideas compuesto por sus propias ideas y las ideas de los usuarios a los que sigue, teniendo en cuenta la visibilidad de cada idea.
         """
         user = info.context.user
-        # Own ideas
-        own_ideas = user.profile.get_my_ideas()
-        # Ideas of the profiles followed by the user
-        followed_ideas = Idea.objects.exclude(visibility=Idea.PRIVATE).filter(
-            profile__followers=user.profile
-        )
-        return (own_ideas | followed_ideas).distinct().order_by("-created")
+        timeline = get_timeline(get_profile_id(user), since)
+        return gather(project(timeline, info))
 
-    def resolve_profile_ideas(self, info, user_id, **kwargs):
+    def resolve_profile_ideas(self, info, user_id, since=None, **kwargs):
         """
         List the ideas of a profile taking into account the visibility of the user in the request
+        Optionally limited to the ideas created from `since`.
         - Un usuario puede ver la lista de ideas de cualquier otro usuario, teniendo en cuenta la visibilidad de cada idea.
         """
         try:
-            profile = Profile.objects.get(pk=user_id)
+            # Not from the identity cache: its deletion must apply right away
+            profile = Profile.objects.active().get(pk=user_id)
         except Profile.DoesNotExist:
             raise GraphQLError("The requested Profile does not exist")
         user = info.context.user
-        user_profile = user.profile if not user.is_anonymous else None
+        viewer_id = get_profile_id(user) if user.is_authenticated else None
 
-        return get_visible_ideas(profile, user_profile)
+        return project(get_visible_ideas(profile, viewer_id, since), info)
 
 
 class CreateIdea(graphene.Mutation):
@@ -87,15 +101,18 @@ class CreateIdea(graphene.Mutation):
     def mutate(self, info, content, **kwargs):
         """
         Creates an idea and optionally sets its visibility to a non-default value.
+        With IDEAS_GROUP_COMMIT on, the idea is committed (and readable) when this
+        returns, but the notifications to the followers are sent afterwards and
+        their failures are only logged (see ideas.group_commit).
         - Un usuario puede publicar una idea como un texto corto en cualquier momento.
         - Un usuario puede establecer la visibilidad de una idea en el momento de su creacion o editarla posteriormente.
         """
         user = info.context.user
 
-        idea = Idea(profile=user.profile, content=content)
+        idea = Idea(profile_id=get_profile_id(user), content=content)
         if "visibility" in kwargs:
             idea.visibility = kwargs["visibility"]
-        idea.save()
+        create_idea(idea)
 
         return CreateIdea(idea=idea)
 
@@ -114,15 +131,18 @@ class UpdateIdeaVisibility(graphene.Mutation):
         - Un usuario puede establecer la visibilidad de una idea en el momento de su creacion o editarla posteriormente.
         """
         try:
-            idea = Idea.objects.get(pk=id)
+            idea = get_by_id(Idea, id)
         except Idea.DoesNotExist:
             raise GraphQLError("The idea you're trying to edit does not exist")
 
         user = info.context.user
         check_permission_user_idea(user, idea)
 
+        # The idea may have been deleted meanwhile
+        ideas = Idea.objects.using(idea._state.db)
+        if not ideas.filter(pk=id).update(visibility=visibility):
+            raise GraphQLError("The idea you're trying to edit does not exist")
         idea.visibility = visibility
-        idea.save()
 
         return UpdateIdeaVisibility(idea=idea)
 
@@ -140,7 +160,7 @@ class DeleteIdea(graphene.Mutation):
         - Un usuario puede borrar una idea publicada.
         """
         try:
-            idea = Idea.objects.get(pk=id)
+            idea = get_by_id(Idea, id)
         except Idea.DoesNotExist:
             raise GraphQLError("The idea you're trying to delete does not exist")
 
@@ -1,3 +1,413 @@
-from django.test import TestCase
+import time
+from datetime import datetime, timezone
+from threading import Event, Thread, Timer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import DatabaseError, connections, router
+from django.db.models.signals import post_save
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ideary.sharding import get_shard
+from ideary.testing import BudgetTestCase, IdearyTestCase
+from ideary.throttling import OverloadedError
+from ideas.group_commit import GroupCommitQueue, _Entry, get_group_commit_queue
+from ideas.ideas_services import filter_since
+from ideas.models import Idea
+from ideas.partitioning import (
+    DEFAULT_PARTITION,
+    IDEA_TABLE,
+    create_partition,
+    ensure_partitions,
+    move_cold_partitions,
+)
+from profiles.models import User
+
+IDEA_FIELDS = "id content visibility created"
+
+
+class IdeasBudgetTest(BudgetTestCase):
+    def test_ideas(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_ideas(profile, size)
+            self.create_ideas(profile, size, visibility=Idea.PROTECTED)
+            follower = self.create_followers(profile, 1)[0]
+            rows = self.count_ideas(visibility=Idea.PUBLIC)
+            # Anonymous and follower (PROTECTED ideas of profile too) requests
+            return [{"rows": rows}, {"rows": rows + size, "user": follower.user}]
+
+        self.assertWithinBudgets("ideas", f"{{ ideas {{ {IDEA_FIELDS} }} }}", seed)
+
+    def test_public_ideas(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_ideas(profile, size)
+            self.create_ideas(profile, size, visibility=Idea.PRIVATE)
+            rows = self.count_ideas(visibility=Idea.PUBLIC)
+            return [{"rows": rows}]
+
+        self.assertWithinBudgets(
+            "publicIdeas", f"{{ publicIdeas {{ {IDEA_FIELDS} }} }}", seed
+        )
+
+    def test_my_ideas(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_ideas(profile, size, visibility=Idea.PRIVATE)
+            return [{"rows": size, "user": profile.user}]
+
+        self.assertWithinBudgets("myIdeas", f"{{ myIdeas {{ {IDEA_FIELDS} }} }}", seed)
+
+    def test_timeline(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_ideas(profile, size)
+            followed = self.create_user()
+            followed.followers.add(profile)
+            self.create_ideas(followed, size, visibility=Idea.PROTECTED)
+            self.create_ideas(followed, size, visibility=Idea.PRIVATE)
+            return [{"rows": 2 * size, "user": profile.user}]
+
+        self.assertWithinBudgets(
+            "timeline", f"{{ timeline {{ {IDEA_FIELDS} }} }}", seed
+        )
+
+    def test_profile_ideas(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_ideas(profile, size)
+            self.create_ideas(profile, size, visibility=Idea.PROTECTED)
+            self.create_ideas(profile, size, visibility=Idea.PRIVATE)
+            follower = self.create_followers(profile, 1)[0]
+            variables = {"id": profile.pk}
+            # Anonymous and follower requests
+            return [
+                {"rows": size, "variables": variables},
+                {"rows": 2 * size, "user": follower.user, "variables": variables},
+            ]
+
+        self.assertWithinBudgets(
+            "profileIdeas",
+            f"query ($id: Int) {{ profileIdeas(userId: $id) {{ {IDEA_FIELDS} }} }}",
+            seed,
+        )
+
+    def test_mutations(self):
+        profile = self.create_user()
+        [idea] = self.create_ideas(profile, 1)
+        for field, query in [
+            ("createIdea", 'mutation { createIdea(content: "Idea") { idea { id } } }'),
+            (
+                "updateIdea",
+                f'mutation {{ updateIdea(id: {idea.pk}, visibility: "PRO") '
+                "{ idea { id } } }",
+            ),
+            ("deleteIdea", f"mutation {{ deleteIdea(id: {idea.pk}) {{ ok }} }}"),
+        ]:
+            with self.subTest(field=field):
+                self.assertWithinBudget(field, query, 1, user=profile.user)
+
+
+class IdeasProjectionTest(IdearyTestCase):
+    def test_projected_timeline(self):
+        profile = self.create_user()
+        followed = self.create_user()
+        followed.followers.add(profile)
+        self.create_ideas(profile, 5)
+        self.create_ideas(followed, 5, visibility=Idea.PROTECTED)
+        self.assertProjected("timeline", IDEA_FIELDS, "profile", user=profile.user)
+
+
+class GroupCommitTest(TransactionTestCase):
+    databases = "__all__"
+
+    def test_group_commit(self):
+        """
+        Concurrent creations are inserted in a single batch, every caller gets its
+        own Idea (or its own error) and the post_save signals are sent for the
+        inserted ones
+        """
+        user = User.objects.create_user(username="writer", email="writer@ideary.test")
+        ideas = [Idea(profile=user.profile, content=f"Idea {i}") for i in range(9)]
+        faulty = Idea(profile=user.profile, content="x" * 501)
+        queue = GroupCommitQueue(window=5, max_batch=10, timeout=5)
+        results = {}
+        signaled = []
+
+        def create(idea):
+            try:
+                results[idea.content] = queue.create(idea)
+            except DatabaseError as error:
+                results[idea.content] = error
+            finally:
+                connections.close_all()
+
+        def on_post_save(sender, instance, created, **kwargs):
+            signaled.append((instance.pk, created))
+
+        post_save.connect(on_post_save, sender=Idea)
+        self.addCleanup(post_save.disconnect, on_post_save, sender=Idea)
+        threads = [Thread(target=create, args=[idea]) for idea in ideas + [faulty]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(queue.batches, 1)
+        self.assertIsInstance(results.pop(faulty.content), DatabaseError)
+        stored = Idea.objects.using(get_shard(user.profile.pk)).in_bulk()
+        for idea in ideas:
+            self.assertIs(results[idea.content], idea)
+            self.assertEqual(stored[idea.pk].content, idea.content)
+        self.assertEqual(len(stored), len(ideas))
+        self.assertEqual(sorted(signaled), sorted((i.pk, True) for i in ideas))
+
+    def test_timeout(self):
+        """
+        The callers whose batch isn't taken in time get an error, and their Idea
+        isn't created
+        """
+        user = User.objects.create_user(username="writer", email="writer@ideary.test")
+        queue = GroupCommitQueue(window=0.05, max_batch=10, timeout=0.05)
+        # The leader of the batch never takes it
+        stuck = _Entry(Idea(profile=user.profile, content="Leader"))
+        queue.pending.append(stuck)
+        with self.assertRaises(OverloadedError):
+            queue.create(Idea(profile=user.profile, content="Follower"))
+        self.assertEqual(queue.pending, [stuck])
+        self.assertFalse(Idea.objects.using(get_shard(user.profile.pk)).exists())
+
+    def test_timeout_while_written(self):
+        """
+        The callers whose batch is being written get their Idea, even if it takes
+        longer than the timeout
+        """
+        user = User.objects.create_user(username="writer", email="writer@ideary.test")
+        queue = GroupCommitQueue(window=0.05, max_batch=2, timeout=0.05)
+        written = Event()
+        insert = queue.insert
+
+        def slow_insert(using, entries):
+            written.wait(5)
+            insert(using, entries)
+
+        queue.insert = slow_insert
+
+        def create_leader():
+            try:
+                queue.create(Idea(profile=user.profile, content="Leader"))
+            finally:
+                connections.close_all()
+
+        leader = Thread(target=create_leader)
+        leader.start()
+        while not queue.pending:
+            time.sleep(0.001)
+        timer = Timer(0.3, written.set)
+        timer.start()
+        try:
+            idea = queue.create(Idea(profile=user.profile, content="Follower"))
+        finally:
+            written.set()
+            leader.join()
+        self.assertIsNotNone(idea.pk)
+        self.assertEqual(queue.batches, 1)
+        self.assertEqual(Idea.objects.using(get_shard(user.profile.pk)).count(), 2)
+
+    def test_full_batch(self):
+        """
+        A full batch is detached right away, so no other Idea joins it
+        """
+        user = User.objects.create_user(username="writer", email="writer@ideary.test")
+        queue = GroupCommitQueue(window=5, max_batch=2, timeout=5)
+        sizes = []
+        insert = queue.insert
+
+        def recorded_insert(using, entries):
+            sizes.append(len(entries))
+            insert(using, entries)
+
+        queue.insert = recorded_insert
+
+        def create(idea):
+            try:
+                queue.create(idea)
+            finally:
+                connections.close_all()
+
+        threads = [
+            Thread(target=create, args=[Idea(profile=user.profile, content=str(i))])
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(sizes, [2, 2])
+        self.assertEqual(Idea.objects.using(get_shard(user.profile.pk)).count(), 4)
+
+    def test_router_error(self):
+        """
+        The callers are released with the error even if the batch can't be grouped
+        """
+        user = User.objects.create_user(username="writer", email="writer@ideary.test")
+        queue = GroupCommitQueue(window=5, max_batch=2, timeout=5)
+        errors = []
+
+        def create(idea):
+            try:
+                queue.create(idea)
+            except RuntimeError as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [
+            Thread(target=create, args=[Idea(profile=user.profile, content="I")])
+            for _ in range(2)
+        ]
+        with mock.patch.object(router, "db_for_write", side_effect=RuntimeError):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+                self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(queue.batches, 0)
+        self.assertFalse(Idea.objects.using(get_shard(user.profile.pk)).exists())
+
+    @override_settings(
+        IDEAS_GROUP_COMMIT={"window": 0.01, "max_batch": 100, "timeout": 5}
+    )
+    def test_max_batch(self):
+        """
+        A batch holds at most the mutations executed at the same time
+        """
+        get_group_commit_queue.cache_clear()
+        self.addCleanup(get_group_commit_queue.cache_clear)
+        limit = settings.GRAPHQL_CONCURRENCY_LIMITS["mutation"]["max_concurrent"]
+        self.assertEqual(get_group_commit_queue().max_batch, min(100, limit))
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class PartitioningTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        user = User.objects.create_user(username="author", email="author@ideary.test")
+        self.profile = user.profile
+        self.shard = get_shard(self.profile.pk)
+        self.connection = connections[self.shard]
+
+    def create_idea(self, created):
+        ideas = Idea.objects.using(self.shard)
+        idea = ideas.create(profile=self.profile, content="Idea")
+        ideas.filter(pk=idea.pk).update(created=created)
+        return idea
+
+    def get_partition(self, idea):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tableoid::regclass::text FROM {IDEA_TABLE} WHERE id = %s",
+                [idea.pk],
+            )
+            return cursor.fetchone()[0]
+
+    def test_ensure_partitions(self):
+        start, now = utc(2001, 1, 15), utc(2001, 3, 1)
+        self.assertEqual(
+            ensure_partitions(self.connection, start, 1, now=now),
+            [f"{IDEA_TABLE}_20010{month}" for month in range(1, 5)],
+        )
+        self.assertEqual(ensure_partitions(self.connection, start, 1, now=now), [])
+        idea = self.create_idea(utc(2001, 2, 10))
+        self.assertEqual(self.get_partition(idea), f"{IDEA_TABLE}_200102")
+
+    def test_create_partition_moves_default_rows(self):
+        """
+        The ideas created while their month had no partition are moved from the
+        DEFAULT partition to it
+        """
+        idea = self.create_idea(utc(2002, 5, 10))
+        other = self.create_idea(utc(2002, 7, 10))
+        self.assertEqual(self.get_partition(idea), DEFAULT_PARTITION)
+        self.assertTrue(create_partition(self.connection, utc(2002, 5, 1)))
+        self.assertFalse(create_partition(self.connection, utc(2002, 5, 1)))
+        self.assertEqual(self.get_partition(idea), f"{IDEA_TABLE}_200205")
+        self.assertEqual(self.get_partition(other), DEFAULT_PARTITION)
+        self.assertEqual(
+            Idea.objects.using(self.shard).filter(profile=self.profile).count(), 2
+        )
+
+    def test_move_cold_partitions(self):
+        now = utc(2001, 4, 1)
+        ensure_partitions(self.connection, utc(2001, 1, 1), 0, now=now)
+        self.assertEqual(
+            move_cold_partitions(self.connection, "pg_default", 2, now=now),
+            [f"{IDEA_TABLE}_200101", f"{IDEA_TABLE}_200102"],
+        )
+
+    def test_filter_since(self):
+        old = self.create_idea(utc(2001, 1, 10))
+        new = self.create_idea(utc(2001, 3, 10))
+        ideas = Idea.objects.using(self.shard).filter(profile=self.profile)
+        self.assertEqual(set(filter_since(ideas)), {old, new})
+        self.assertEqual(list(filter_since(ideas, utc(2001, 2, 1))), [new])
+
+
+class IdeaMutationsTest(IdearyTestCase):
+    def test_update_deleted_idea(self):
+        """
+        An idea deleted by another process can't be updated (nor deleted)
+        """
+        profile = self.create_user()
+        [idea] = self.create_ideas(profile, 1)
+        Idea.objects.using(get_shard(profile.pk)).filter(pk=idea.pk).delete()
+        for mutation, message in [
+            (
+                f'updateIdea(id: {idea.pk}, visibility: "PRI") {{ idea {{ id }} }}',
+                "edit",
+            ),
+            (f"deleteIdea(id: {idea.pk}) {{ ok }}", "delete"),
+        ]:
+            result, _, _ = self.execute(f"mutation {{ {mutation} }}", profile.user)
+            self.assertEqual(
+                [error.message for error in result.errors],
+                [f"The idea you're trying to {message} does not exist"],
+            )
+
+    def test_update_unknown_idea(self):
+        """
+        The ids out of the range of every shard don't exist
+        """
+        profile = self.create_user()
+        for id in (0, 2000000000):
+            for mutation, message in [
+                (
+                    f'updateIdea(id: {id}, visibility: "PRI") {{ idea {{ id }} }}',
+                    "edit",
+                ),
+                (f"deleteIdea(id: {id}) {{ ok }}", "delete"),
+            ]:
+                result, _, _ = self.execute(f"mutation {{ {mutation} }}", profile.user)
+                self.assertEqual(
+                    [error.message for error in result.errors],
+                    [f"The idea you're trying to {message} does not exist"],
+                )
+
+    def test_update_idea(self):
+        profile = self.create_user()
+        [idea] = self.create_ideas(profile, 1)
+        result, _, _ = self.execute(
+            f'mutation {{ updateIdea(id: {idea.pk}, visibility: "PRI") '
+            "{ idea { visibility } } }",
+            profile.user,
+        )
+        self.assertEqual(result.data, {"updateIdea": {"idea": {"visibility": "PRI"}}})
+        stored = Idea.objects.using(get_shard(profile.pk)).get(pk=idea.pk)
+        self.assertEqual(stored.visibility, Idea.PRIVATE)
+        self.assertEqual(stored.content, idea.content)
@@ -0,0 +1,62 @@
+"""
+Visibility policy of the Ideas, compiled into SQL predicates (Q objects) that can be
+composed onto any Idea queryset. An Idea is visible to a viewer (Profile) when:
+- It's PUBLIC
+- It's PROTECTED and the viewer follows its author (an EXISTS on the follower edge,
+  served by the unique index of the profiles_profile_followers table)
+- The viewer is its author (PRIVATE ideas included)
+Anonymous viewers (None) only see the PUBLIC ones.
+"""
+from django.db.models import Exists, OuterRef, Q
+
+from profiles.models import Profile
+
+from .models import Idea
+
+# Follower edges: from_profile (followed) -> to_profile (follower)
+Follow = Profile.followers.through
+
+
+def followed_by(viewer_id):
+    """
+    Returns the predicate of the Ideas whose author is followed by the viewer
+    """
+    return Q(
+        Exists(
+            Follow.objects.filter(
+                from_profile=OuterRef("profile"), to_profile=viewer_id
+            )
+        )
+    )
+
+
+def visible_to(viewer_id=None):
+    """
+    Returns the predicate of the Ideas visible to the viewer (Profile id, None for
+    anonymous viewers)
+    """
+    predicate = Q(visibility=Idea.PUBLIC)
+    if viewer_id is None:
+        return predicate
+    return (
+        predicate
+        | (Q(visibility=Idea.PROTECTED) & followed_by(viewer_id))
+        | Q(profile=viewer_id)
+    )
+
+
+def in_timeline_of(viewer_id):
+    """
+    Returns the predicate of the Ideas in the timeline of the viewer: their own ideas
+    and the visible ones of the Profiles they follow
+    """
+    return Q(profile=viewer_id) | (
+        Q(visibility__in=[Idea.PUBLIC, Idea.PROTECTED]) & followed_by(viewer_id)
+    )
+
+
+def filter_visible(ideas, viewer_id=None):
+    """
+    Limits an Idea queryset to the ideas visible to the viewer
+    """
+    return ideas.filter(visible_to(viewer_id))
@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from profiles.profiles_services import archive_followrequests
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves in bounded batches the FollowRequests resolved more than the retention "
+        "days ago to their history table. Run it periodically or as a background "
+        "worker with --forever."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.FOLLOWREQUEST_RETENTION_DAYS,
+            help="Archive the FollowRequests resolved more than these days ago",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Maximum number of rows archived per statement",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Seconds to wait between batches to not saturate the database",
+        )
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="Keep archiving the FollowRequests as they get old",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=3600,
+            help="Seconds to wait between runs when running with --forever",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            before = timezone.now() - timedelta(days=options["days"])
+            archived = archive_followrequests(
+                before, batch_size=options["batch_size"], pause=options["pause"]
+            )
+            self.stdout.write(f"Archived {archived} follow requests")
+            if not options["forever"]:
+                break
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.profiles_services import get_accounts_to_purge, purge_account
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes in bounded batches the data of the accounts whose deletion has been "
+        "requested. Run it periodically or as a background worker with --forever."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Maximum number of rows deleted per statement",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Seconds to wait between batches to not saturate the database",
+        )
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="Keep polling for new account deletions",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=30,
+            help="Seconds to wait between polls when running with --forever",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for profile in get_accounts_to_purge():
+                deleted = purge_account(
+                    profile, batch_size=options["batch_size"], pause=options["pause"]
+                )
+                summary = ", ".join(
+                    f"{count} {table}" for table, count in deleted.items()
+                )
+                self.stdout.write(f"Purged account {profile.user}: {summary}")
+            if not options["forever"]:
+                break
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ideary.identity_cache import IDENTITY_CACHE, get_identity_cache
+from ideary.warming import (
+    WarmingPool,
+    get_active_profile_ids,
+    get_popular_profile_ids,
+    is_shared_cache,
+    warm_profile,
+    warm_profile_ideas,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Warms the caches with the timelines of the recently active Profiles and the "
+        "ideas of the most followed ones. Run it after every deploy or cache flush. The "
+        f"{IDENTITY_CACHE!r} cache is only warmed when it's shared between processes "
+        "(e.g. memcached), otherwise only the database is."
+    )
+
+    def add_arguments(self, parser):
+        config = settings.CACHE_WARMING
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=config["page_size"],
+            help="Number of ideas warmed per timeline or Profile",
+        )
+        parser.add_argument(
+            "--active-days",
+            type=int,
+            default=config["active_days"],
+            help="Warm the timelines of the Profiles logged in these last days",
+        )
+        parser.add_argument(
+            "--popular",
+            type=int,
+            default=config["popular"],
+            help="Warm the ideas of this number of most followed Profiles",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=config["workers"],
+            help="Number of threads warming in parallel",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=config["rate"],
+            help="Maximum number of Profiles warmed per second",
+        )
+
+    def handle(self, *args, **options):
+        # A per process cache warmed here wouldn't be seen by the web workers
+        cache = is_shared_cache(get_identity_cache())
+        if not cache:
+            self.stdout.write(
+                f"The {IDENTITY_CACHE!r} cache is per process: warming the database only"
+            )
+        workers = options["workers"]
+        pool = WarmingPool(workers, workers, options["rate"])
+        page_size = options["page_size"]
+        active = get_active_profile_ids(options["active_days"])
+        popular = get_popular_profile_ids(options["popular"])
+        for profile_id in active:
+            pool.submit(warm_profile, profile_id, page_size, cache, block=True)
+        for profile_id in popular:
+            pool.submit(warm_profile_ideas, profile_id, page_size, block=True)
+        pool.join()
+        self.stdout.write(
+            f"Warmed {len(active)} timelines and {len(popular)} profile ideas "
+            f"({pool.completed} tasks completed, {pool.failed} failed)"
+        )
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_auto_20211107_1524'),
+    ]
+
+    operations = [
+        # Keep only the oldest FollowRequest between two profiles before enforcing it
+        migrations.RunSQL(
+            """
+            DELETE FROM profiles_followrequest duplicated
+            USING profiles_followrequest kept
+            WHERE duplicated.requestor_id = kept.requestor_id
+            AND duplicated.requested_id = kept.requested_id
+            AND duplicated.id > kept.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='followrequest',
+            constraint=models.UniqueConstraint(fields=('requestor', 'requested'), name='unique_followrequest'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-19 15:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_followrequest_unique_followrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='deletion_requested',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
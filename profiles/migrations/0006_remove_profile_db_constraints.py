@@ -0,0 +1,29 @@
+# Generated by Django 3.0.5 on 2026-10-19 16:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0005_profile_deletion_requested'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='followrequest',
+            name='requested',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pending_requests', related_query_name='pending_request', to='profiles.Profile'),
+        ),
+        migrations.AlterField(
+            model_name='followrequest',
+            name='requestor',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='requests', related_query_name='request', to='profiles.Profile'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='followers',
+            field=models.ManyToManyField(blank=True, db_constraint=False, to='profiles.Profile'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.0.5 on 2026-10-19 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0006_remove_profile_db_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowRequestHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requestor_id', models.IntegerField()),
+                ('requested_id', models.IntegerField(db_index=True)),
+                ('status', models.CharField(choices=[('PEN', 'Pending'), ('APP', 'Approved'), ('REJ', 'Rejected')], max_length=3)),
+                ('resolved', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='followrequest',
+            name='resolved',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # The FollowRequests already resolved start their retention period now
+        migrations.RunSQL(
+            "UPDATE profiles_followrequest SET resolved = now() WHERE status <> 'PEN'",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='followrequest',
+            index=models.Index(condition=models.Q(status='PEN'), fields=['requested'], name='followrequest_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='followrequest',
+            index=models.Index(condition=models.Q(_negated=True, status='PEN'), fields=['resolved'], name='followrequest_resolved'),
+        ),
+    ]
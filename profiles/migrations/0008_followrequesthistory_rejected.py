@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2026-10-19 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0007_followrequest_retention'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='followrequesthistory',
+            index=models.Index(condition=models.Q(status='REJ'), fields=['requested_id', 'requestor_id'], name='followrequesthistory_rejected'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.0.5 on 2026-10-19 16:45
+
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+
+def create_tombstones(apps, schema_editor):
+    """
+    Writes the tombstones of the Profiles whose account deletion is already requested
+    to the database being migrated (every shard is migrated on its own)
+    """
+    Profile = apps.get_model("profiles", "Profile")
+    DeletedProfile = apps.get_model("profiles", "DeletedProfile")
+    deleted = Profile.objects.using(DEFAULT_DB_ALIAS).filter(
+        deletion_requested__isnull=False
+    )
+    DeletedProfile.objects.using(schema_editor.connection.alias).bulk_create(
+        [
+            DeletedProfile(profile_id=pk, deletion_requested=deletion_requested)
+            for pk, deletion_requested in deleted.values_list("pk", "deletion_requested")
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0008_followrequesthistory_rejected'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedProfile',
+            fields=[
+                ('profile_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('deletion_requested', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(create_tombstones, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,72 @@
-from django.db import models
+from django.db import connections, models, transaction
 from django.contrib.auth.models import AbstractUser
-
-from django.db.models.signals import post_save
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
+from django.utils import timezone
+from graphql_jwt.signals import token_issued
+
+from ideary.identity_cache import invalidate_cached_object
+from ideary.passwords import hash_password, verify_password
+from ideary.sharding import get_shard, scatter, set_id_range, values_in_default
 
 
 class User(AbstractUser):
 
     email = models.EmailField(blank=True, unique=True)
 
+    def set_password(self, raw_password):
+        """
+        Same as AbstractUser.set_password, hashing it in the password pool
+        """
+        self.password = hash_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        Same as AbstractUser.check_password, verifying it in the password pool. The
+        hashes of other hashers (or outdated iterations) are upgraded to the preferred
+        hasher (the first of PASSWORD_HASHERS)
+        """
+        valid, must_update = verify_password(raw_password, self.password)
+        if must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+        return valid
+
+
+def is_deleted_profile(field):
+    """
+    Returns the condition of the rows whose `field` is the id of a Profile whose
+    account deletion has been requested (see DeletedProfile), to exclude them:
+    queryset.exclude(is_deleted_profile("profile_id")). It's a join evaluated in the
+    database of the queryset, so it works in any shard
+    """
+    return Exists(DeletedProfile.objects.filter(profile_id=OuterRef(field)))
+
+
+class ProfileQuerySet(models.QuerySet):
+    def active(self):
+        """
+        Excludes the Profiles whose account deletion has been requested
+        """
+        return self.filter(deletion_requested__isnull=True)
+
 
 class Profile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    followers = models.ManyToManyField("self", symmetrical=False, blank=True)
+    # The follower edges live in the shard of the followed Profile (from_profile), so
+    # they must be added from its side: followed.followers.add(follower)
+    followers = models.ManyToManyField(
+        "self", symmetrical=False, blank=True, db_constraint=False
+    )
+    # Set when the account deletion is requested. The Profile is hidden since then
+    # until its data is purged by the `purge_deleted_accounts` worker
+    deletion_requested = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = ProfileQuerySet.as_manager()
 
     def __str__(self) -> str:
         return str(self.user)
@@ -28,21 +81,31 @@ class Profile(models.Model):
         """
         Returns a queryset with all the PENDING FollowRequest a Profile have received
         """
-        return FollowRequest.objects.filter(
-            requested=self, status=FollowRequest.PENDING
+        return (
+            FollowRequest.objects.using(get_shard(self.pk))
+            .filter(requested=self, status=FollowRequest.PENDING)
+            .exclude(is_deleted_profile("requestor_id"))
         )
 
     def get_followers(self):
         """
         Returns the queryset of all the Profile following this Profile instance
         """
-        return self.followers.all()
+        follower_ids = (
+            Profile.followers.through.objects.using(get_shard(self.pk))
+            .filter(from_profile=self)
+            .values_list("to_profile_id", flat=True)
+        )
+        return Profile.objects.active().filter(pk__in=values_in_default(follower_ids))
 
     def get_following(self):
         """
         Returns the queryset of all the Profiles this instance is Following
         """
-        return Profile.objects.filter(followers=self)
+        following_ids = Profile.followers.through.objects.filter(
+            to_profile=self
+        ).values_list("from_profile_id", flat=True)
+        return Profile.objects.active().filter(pk__in=scatter(following_ids))
 
 
 class FollowRequest(models.Model):
@@ -56,37 +119,83 @@ class FollowRequest(models.Model):
     requestor = models.ForeignKey(
         Profile,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name="requests",
         related_query_name="request",
     )
     requested = models.ForeignKey(
         Profile,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name="pending_requests",
         related_query_name="pending_request",
     )
     status = models.CharField(max_length=3, choices=STATUSES, default=PENDING)
-
-    def approve(self):
-        """
-        Approves a FollowRequest, adding the requestor profile to the followers list of
-        the requested profile
-        """
-        self.status = self.APPROVED
-        self.save()
-        self.requested.followers.add(self.requestor)
-
-    def reject(self):
-        """
-        Rejects a FollowRequest, setting its status to REJECTED
-        """
-        self.status = self.REJECTED
-        self.save()
+    # When it was approved or rejected. The resolved FollowRequests are moved to
+    # FollowRequestHistory after FOLLOWREQUEST_RETENTION_DAYS
+    resolved = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["requestor", "requested"], name="unique_followrequest"
+            )
+        ]
+        indexes = [
+            # The PENDING FollowRequests received (see get_my_followrequests)
+            models.Index(
+                fields=["requested"],
+                condition=models.Q(status="PEN"),
+                name="followrequest_pending",
+            ),
+            # The resolved FollowRequests to archive (see archive_followrequests)
+            models.Index(
+                fields=["resolved"],
+                condition=~models.Q(status="PEN"),
+                name="followrequest_resolved",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"From {self.requestor} to {self.requested}: {self.get_status_display()}"
 
 
+class FollowRequestHistory(models.Model):
+    """
+    Compact record of the FollowRequests resolved long ago (see
+    archive_followrequests), out of the table of the live ones. It lives in the shard
+    of the requested Profile, as the FollowRequests. The rejected ones still keep
+    their requestor from requesting again (see create_followrequest)
+    """
+
+    requestor_id = models.IntegerField()
+    requested_id = models.IntegerField(db_index=True)
+    status = models.CharField(max_length=3, choices=FollowRequest.STATUSES)
+    resolved = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The rejected requests of a pair of Profiles (see create_followrequest)
+            models.Index(
+                fields=["requested_id", "requestor_id"],
+                condition=models.Q(status="REJ"),
+                name="followrequesthistory_rejected",
+            )
+        ]
+
+
+class DeletedProfile(models.Model):
+    """
+    Tombstone of a Profile whose account deletion has been requested, written to every
+    shard (see request_account_deletion) so the rows the Profile owns in any shard are
+    hidden with a join (see is_deleted_profile). It's removed when the Profile is
+    purged
+    """
+
+    profile_id = models.IntegerField(primary_key=True)
+    deletion_requested = models.DateTimeField()
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """
@@ -97,10 +206,32 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    """
+    Signal to remove a saved/deleted Profile from the identity cache
+    """
+    invalidate_cached_object(Profile, instance.pk, user=instance.user_id)
+
+
+@receiver(token_issued)
+def warm_logged_in_user(sender, request, user, **kwargs):
+    """
+    Signal to record the login of a User (see get_active_profile_ids) and warm its
+    Profile in background
+    """
+    # Imported here, as the warming depends on the ideas app
+    from ideary.warming import warm_on_login
+
+    User.objects.filter(pk=user.pk).update(last_login=timezone.now())
+    transaction.on_commit(lambda: warm_on_login(user))
+
+
+@receiver(post_migrate)
+def set_followrequest_id_range(sender, using, **kwargs):
     """
-    Post save signal to automatically update the asociated Profile to a User when it's
-    updated
+    Signal to make the FollowRequest ids of a shard unique across the shards, after
+    migrating it
     """
-    instance.profile.save()
+    if sender.label == "profiles":
+        set_id_range(connections[using], FollowRequest._meta.db_table)
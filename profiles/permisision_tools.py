@@ -1,5 +1,7 @@
 from graphql.error.base import GraphQLError
 
+from profiles.profiles_services import get_profile_id
+
 
 def check_user_logged(user) -> bool:
     """
@@ -15,7 +17,7 @@ def check_permission_user_idea(user, idea) -> bool:
     Check if the User has permissions over an Idea.
     Initially a user will have permissions over an idea if the user is its owner
     """
-    if not idea.profile.user == user:
+    if idea.profile_id != get_profile_id(user):
         raise GraphQLError("You have not permissions to edit/delete this idea")
     return True
 
@@ -27,6 +29,6 @@ def check_permission_user_followrequest(
     Check if the User has permissions over a FollowRequest.
     Initially a user will have permissions over a FollowRequest if the user is the requested Profile
     """
-    if not followrequest.requested.user == user:
+    if followrequest.requested_id != get_profile_id(user):
         raise GraphQLError(f"You have not permissions to {action} this Follow Request")
     return True
@@ -0,0 +1,312 @@
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from ideary.identity_cache import (
+    get_cached_object,
+    get_cached_value,
+    invalidate_cached_object,
+)
+from ideary.sharding import get_shard, get_shards
+from ideas.models import Idea
+
+from .models import DeletedProfile, FollowRequest, FollowRequestHistory, Profile, User
+
+IDEA_TABLE = Idea._meta.db_table
+FOLLOWREQUEST_TABLE = FollowRequest._meta.db_table
+FOLLOWREQUEST_HISTORY_TABLE = FollowRequestHistory._meta.db_table
+FOLLOWERS_TABLE = Profile.followers.through._meta.db_table
+PROFILE_TABLE = Profile._meta.db_table
+DELETED_PROFILE_TABLE = DeletedProfile._meta.db_table
+FOLLOWREQUEST_COLUMNS = ["id", "requestor_id", "requested_id", "status", "resolved"]
+RETURNING_FOLLOWREQUEST = "RETURNING " + ", ".join(FOLLOWREQUEST_COLUMNS)
+
+
+def get_profile_id(user):
+    """
+    Returns the id of the Profile of a User without loading the Profile (the id is
+    kept in the identity cache)
+    """
+    return get_cached_value(
+        Profile,
+        "user",
+        user.pk,
+        lambda: Profile.objects.filter(user=user).values_list("pk", flat=True).first(),
+    )
+
+
+def get_user_profile(user):
+    """
+    Returns the Profile of a User from the identity cache
+    """
+    return get_cached_object(Profile, get_profile_id(user))
+
+
+def _fetch_followrequest(using, sql, params):
+    """
+    Executes (in the `using` database) a statement RETURNING the FollowRequest columns
+    and builds the FollowRequest instance from the returned row (None if no row was
+    returned)
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return FollowRequest.from_db(using, FOLLOWREQUEST_COLUMNS, row)
+
+
+def create_followrequest(requestor_id, requested_id):
+    """
+    Creates a PENDING FollowRequest from requestor to requested (Profile ids) in a
+    single statement (in the shard of the requested Profile). Returns None if the
+    requested Profile does not exist (or its account deletion has been requested),
+    there is already a FollowRequest between both profiles (even if it was rejected
+    and archived) or the requestor already follows the requested Profile (its approved
+    FollowRequest may have been archived)
+    """
+    shard = get_shard(requested_id)
+    if shard == DEFAULT_DB_ALIAS:
+        # The requested Profile is checked by the same statement
+        requested = (
+            f"SELECT id FROM {PROFILE_TABLE} "
+            "WHERE id = %s AND deletion_requested IS NULL"
+        )
+    elif Profile.objects.active().filter(pk=requested_id).exists():
+        requested = "SELECT %s AS id"
+    else:
+        return None
+    return _fetch_followrequest(
+        shard,
+        f"""
+        INSERT INTO {FOLLOWREQUEST_TABLE} (requestor_id, requested_id, status)
+        SELECT %s, requested.id, %s FROM ({requested}) AS requested
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {FOLLOWERS_TABLE}
+            WHERE from_profile_id = requested.id AND to_profile_id = %s
+        ) AND NOT EXISTS (
+            SELECT 1 FROM {FOLLOWREQUEST_HISTORY_TABLE}
+            WHERE requested_id = requested.id AND requestor_id = %s AND status = %s
+        )
+        ON CONFLICT (requestor_id, requested_id) DO NOTHING
+        {RETURNING_FOLLOWREQUEST}
+        """,
+        [
+            requestor_id,
+            FollowRequest.PENDING,
+            requested_id,
+            requestor_id,
+            requestor_id,
+            FollowRequest.REJECTED,
+        ],
+    )
+
+
+def approve_followrequest(followrequest_id, requested_id):
+    """
+    Approves a PENDING (or previously REJECTED) FollowRequest received by the
+    requested Profile id and adds its requestor to the followers, both in a single
+    statement (in the shard of the requested Profile). Returns None if there is no such
+    FollowRequest to approve
+    """
+    return _fetch_followrequest(
+        get_shard(requested_id),
+        f"""
+        WITH approved AS (
+            UPDATE {FOLLOWREQUEST_TABLE} SET status = %s, resolved = now()
+            WHERE id = %s AND requested_id = %s AND status IN (%s, %s)
+            {RETURNING_FOLLOWREQUEST}
+        ), follower AS (
+            INSERT INTO {FOLLOWERS_TABLE} (from_profile_id, to_profile_id)
+            SELECT requested_id, requestor_id FROM approved
+            ON CONFLICT DO NOTHING
+        )
+        SELECT * FROM approved
+        """,
+        [
+            FollowRequest.APPROVED,
+            followrequest_id,
+            requested_id,
+            FollowRequest.PENDING,
+            FollowRequest.REJECTED,
+        ],
+    )
+
+
+def reject_followrequest(followrequest_id, requested_id):
+    """
+    Rejects a PENDING FollowRequest received by the requested Profile id in a single
+    statement. Returns None if there is no such PENDING FollowRequest
+    """
+    return _fetch_followrequest(
+        get_shard(requested_id),
+        f"""
+        UPDATE {FOLLOWREQUEST_TABLE} SET status = %s, resolved = now()
+        WHERE id = %s AND requested_id = %s AND status = %s
+        {RETURNING_FOLLOWREQUEST}
+        """,
+        [FollowRequest.REJECTED, followrequest_id, requested_id, FollowRequest.PENDING],
+    )
+
+
+def remove_follow(followed_id, follower_id):
+    """
+    Removes the follower Profile id from the followers of the followed Profile id,
+    along with the FollowRequest between them (so it can be requested again), in a
+    single statement (in the shard of the followed Profile). Returns True if there was
+    something to remove
+    """
+    with connections[get_shard(followed_id)].cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH follower AS (
+                DELETE FROM {FOLLOWERS_TABLE}
+                WHERE from_profile_id = %s AND to_profile_id = %s
+                RETURNING 1
+            ), request AS (
+                DELETE FROM {FOLLOWREQUEST_TABLE}
+                WHERE requested_id = %s AND requestor_id = %s
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM follower) + (SELECT COUNT(*) FROM request)
+            """,
+            [followed_id, follower_id, followed_id, follower_id],
+        )
+        return cursor.fetchone()[0] > 0
+
+
+def request_account_deletion(user):
+    """
+    Disables the account of the User right away: it can't log in anymore and its
+    Profile (along with the rows it owns in every shard) is hidden. The data is
+    removed later in batches by `purge_account`
+    """
+    profile_id = get_profile_id(user)
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            Profile.objects.filter(pk=profile_id).update(deletion_requested=now)
+            User.objects.filter(pk=user.pk).update(is_active=False)
+            # Written before the default database commits, so no shard shows the rows
+            # of a Profile already hidden
+            for shard in get_shards():
+                DeletedProfile.objects.using(shard).bulk_create(
+                    [DeletedProfile(profile_id=profile_id, deletion_requested=now)],
+                    ignore_conflicts=True,
+                )
+    except Exception:
+        # The tombstones already committed in the other shards would hide the rows of
+        # a Profile that is still active
+        for shard in get_shards():
+            if shard != DEFAULT_DB_ALIAS:
+                DeletedProfile.objects.using(shard).filter(
+                    profile_id=profile_id, deletion_requested=now
+                ).delete()
+        raise
+    invalidate_cached_object(Profile, profile_id)
+
+
+def _delete_in_batches(using, table, key, where_column, profile_id, batch_size, pause):
+    """
+    Deletes the rows of table (in the `using` database) whose where_column is
+    profile_id, at most batch_size rows per statement (and transaction). Returns the
+    number of deleted rows
+    """
+    deleted = 0
+    while True:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"""
+                DELETE FROM {table} WHERE ({key}) IN (
+                    SELECT {key} FROM {table} WHERE {where_column} = %s LIMIT %s
+                )
+                """,
+                [profile_id, batch_size],
+            )
+            rowcount = cursor.rowcount
+        deleted += rowcount
+        if rowcount < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def purge_account(profile, batch_size=1000, pause=0):
+    """
+    Removes all the data of a Profile whose deletion has been requested (ideas,
+    follow requests and followers in both directions) in bounded batches, and then
+    the Profile and its User. The rows of every shard are deleted, as the follow
+    requests sent and the profiles followed live in the shards of the other Profiles.
+    Returns the number of deleted rows per table
+    """
+    batches = [
+        # The idea partitions are looked up by the whole primary key (id, created)
+        (IDEA_TABLE, "id, created", "profile_id"),
+        (FOLLOWREQUEST_TABLE, "id", "requestor_id"),
+        (FOLLOWREQUEST_TABLE, "id", "requested_id"),
+        (FOLLOWREQUEST_HISTORY_TABLE, "id", "requestor_id"),
+        (FOLLOWREQUEST_HISTORY_TABLE, "id", "requested_id"),
+        (FOLLOWERS_TABLE, "id", "from_profile_id"),
+        (FOLLOWERS_TABLE, "id", "to_profile_id"),
+        # Last, so the rows left by an interrupted purge are still hidden
+        (DELETED_PROFILE_TABLE, "profile_id", "profile_id"),
+    ]
+    deleted = {}
+    for shard in get_shards():
+        for table, key, where_column in batches:
+            deleted[table] = deleted.get(table, 0) + _delete_in_batches(
+                shard, table, key, where_column, profile.pk, batch_size, pause
+            )
+    # Nothing is left to cascade, so the collector deletes just these two rows
+    profile.user.delete()
+    return deleted
+
+
+def get_accounts_to_purge():
+    """
+    Returns the queryset of Profiles whose account deletion has been requested,
+    oldest request first
+    """
+    return (
+        Profile.objects.filter(deletion_requested__isnull=False)
+        .select_related("user")
+        .order_by("deletion_requested")
+    )
+
+
+def archive_followrequests(before, batch_size=1000, pause=0):
+    """
+    Moves the FollowRequests resolved (APPROVED or REJECTED) before the given
+    datetime to FollowRequestHistory, at most batch_size rows per statement (and
+    transaction) in every shard. The approved ones are kept by the follower edge, and
+    the rejected ones still can't be requested again. Returns the number of archived
+    rows
+    """
+    archived = 0
+    for shard in get_shards():
+        while True:
+            with connections[shard].cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    WITH archived AS (
+                        DELETE FROM {FOLLOWREQUEST_TABLE} WHERE id IN (
+                            SELECT id FROM {FOLLOWREQUEST_TABLE}
+                            WHERE status <> %s AND resolved < %s
+                            LIMIT %s FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING requestor_id, requested_id, status, resolved
+                    )
+                    INSERT INTO {FOLLOWREQUEST_HISTORY_TABLE}
+                        (requestor_id, requested_id, status, resolved)
+                    SELECT requestor_id, requested_id, status, resolved FROM archived
+                    """,
+                    [FollowRequest.PENDING, before, batch_size],
+                )
+                rowcount = cursor.rowcount
+            archived += rowcount
+            if rowcount < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return archived
@@ -4,11 +4,23 @@ from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 from graphql.error.base import GraphQLError
 
+from ideary.projection import ProjectableType, project
+from ideas.ideas_services import get_visible_ideas
+from ideary.sharding import get_by_id, scatter
 from profiles.permisision_tools import (
     check_permission_user_followrequest,
 )
 
 from .models import FollowRequest, Profile, User
+from .profiles_services import (
+    approve_followrequest,
+    create_followrequest,
+    get_profile_id,
+    get_user_profile,
+    reject_followrequest,
+    remove_follow,
+    request_account_deletion,
+)
 
 
 class UserType(DjangoObjectType):
@@ -16,12 +28,36 @@ class UserType(DjangoObjectType):
         model = User
 
 
-class ProfileType(DjangoObjectType):
+class ProfileType(ProjectableType, DjangoObjectType):
     class Meta:
         model = Profile
         filter_fields = {"user__username": ["exact", "icontains", "istartswith"]}
         interfaces = (graphene.relay.Node,)
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return queryset.active()
+
+    # The follower edges and the FollowRequests sent live in the shards, so they
+    # can't be joined to the Profiles
+    def resolve_followers(self, info, **kwargs):
+        return self.get_followers()
+
+    def resolve_profile_set(self, info, **kwargs):
+        return self.get_following()
+
+    def resolve_requests(self, info, **kwargs):
+        return scatter(FollowRequest.objects.filter(requestor=self))
+
+    def resolve_idea_set(self, info, **kwargs):
+        """
+        The ideas of the Profile visible to the user of the request (see
+        ideas.visibility)
+        """
+        user = info.context.user
+        viewer_id = get_profile_id(user) if user.is_authenticated else None
+        return get_visible_ideas(self, viewer_id)
+
 
 class FollowRequestType(DjangoObjectType):
     class Meta:
@@ -39,10 +75,10 @@ class Query(graphene.ObjectType):
     my_follow_requests = graphene.List(FollowRequestType)
 
     def resolve_profiles(self, info, **kwargs):
-        return Profile.objects.all()
+        return project(Profile.objects.active(), info)
 
     def resolve_users(self, info, **kwargs):
-        return User.objects.all()
+        return User.objects.filter(profile__deletion_requested__isnull=True)
 
     @login_required
     def resolve_me(self, info, **kwargs):
@@ -56,7 +92,7 @@ class Query(graphene.ObjectType):
         - Un usuario puede ver el listado de gente que le sigue
         """
         user = info.context.user
-        return user.profile.get_followers()
+        return project(get_user_profile(user).get_followers(), info)
 
     @login_required
     def resolve_following(self, info, **kwargs):
@@ -65,7 +101,7 @@ class Query(graphene.ObjectType):
         - Un usuario puede ver el listado de gente a la que sigue
         """
         user = info.context.user
-        return user.profile.get_following()
+        return project(get_user_profile(user).get_following(), info)
 
     @login_required
     def resolve_my_follow_requests(self, info, **kwargs):
@@ -74,7 +110,30 @@ class Query(graphene.ObjectType):
         - Un usuario puede ver el listado de solicitudes de seguimiento recibidas y aprobarlas o denegarlas
         """
         user = info.context.user
-        return user.profile.get_my_followrequests()
+        return get_user_profile(user).get_my_followrequests()
+
+
+def get_unresolvable_followrequest(user, follow_request_id, action):
+    """
+    Returns the FollowRequest that couldn't be accepted/denied by the User, raising
+    the GraphQLError that explains why (it does not exist or it's not theirs)
+    """
+    try:
+        followrequest = get_by_id(FollowRequest, follow_request_id)
+    except FollowRequest.DoesNotExist:
+        raise GraphQLError(
+            f"The Follow Request you're trying to {action} does not exist"
+        )
+    check_permission_user_followrequest(user, followrequest, action=action)
+    return followrequest
+
+
+def check_profile_exists(profile_id):
+    """
+    Raises a GraphQLError if there is no Profile with the given id
+    """
+    if not Profile.objects.filter(pk=profile_id).exists():
+        raise GraphQLError("The Profile of your request does not exist")
 
 
 class CreateUser(graphene.Mutation):
@@ -107,11 +166,27 @@ class UpdatePassword(graphene.Mutation):
         """
         user = info.context.user
         user.set_password(password)
-        user.save()
+        # Only the password: the rest of the instance may be outdated (e.g. its
+        # account deletion requested meanwhile)
+        user.save(update_fields=["password"])
 
         return UpdatePassword(user=user)
 
 
+class DeleteAccount(graphene.Mutation):
+    ok = graphene.Boolean()
+
+    @login_required
+    def mutate(self, info, **kwargs):
+        """
+        Deletes the account of the logged User. It's disabled (and hidden) right away
+        and its data is removed in background by the `purge_deleted_accounts` worker
+        """
+        user = info.context.user
+        request_account_deletion(user)
+        return DeleteAccount(ok=True)
+
+
 class CreateFollowRequest(graphene.Mutation):
     followrequest = graphene.Field(FollowRequestType)
 
@@ -126,20 +201,10 @@ class CreateFollowRequest(graphene.Mutation):
         - Un usuario puede solicitar seguir a otro usuario
         """
         user = info.context.user
-        requestor = user.profile
-        try:
-            requested = Profile.objects.get(pk=requested_id)
-        except Profile.DoesNotExist:
-            raise GraphQLError("The Profile you're trying to follow does not exist")
-        if not FollowRequest.objects.filter(
-            requested=requested, requestor=requestor
-        ).exists():
-            followrequest = FollowRequest(
-                requestor=requestor,
-                requested=requested,
-            )
-            followrequest.save()
-        else:
+        followrequest = create_followrequest(get_profile_id(user), requested_id)
+        if followrequest is None:
+            if not Profile.objects.active().filter(pk=requested_id).exists():
+                raise GraphQLError("The Profile you're trying to follow does not exist")
             raise GraphQLError("It already exists a FollowRequest to that Profile")
         return CreateFollowRequest(followrequest=followrequest)
 
@@ -157,15 +222,13 @@ class AcceptFollowRequest(graphene.Mutation):
         - Un usuario puede ver el listado de solicitudes de seguimiento recibidas y aprobarlas o denegarlas
         """
         user = info.context.user
-        requestor = user.profile
-        try:
-            followrequest = FollowRequest.objects.get(pk=follow_request_id)
-        except FollowRequest.DoesNotExist:
-            raise GraphQLError(
-                "The Follow Request you're trying to accept does not exist"
+        followrequest = approve_followrequest(follow_request_id, get_profile_id(user))
+        if followrequest is None:
+            followrequest = get_unresolvable_followrequest(
+                user, follow_request_id, action="accept"
             )
-        if check_permission_user_followrequest(user, followrequest, action="accept"):
-            followrequest.approve()
+            if followrequest.status != FollowRequest.APPROVED:
+                raise GraphQLError("The Follow Request can't be accepted")
 
         return AcceptFollowRequest(followrequest=followrequest)
 
@@ -183,16 +246,13 @@ class DenyFollowRequest(graphene.Mutation):
         - Un usuario puede ver el listado de solicitudes de seguimiento recibidas y aprobarlas o denegarlas
         """
         user = info.context.user
-        requestor = user.profile
-        try:
-            followrequest = FollowRequest.objects.get(pk=follow_request_id)
-        except FollowRequest.DoesNotExist:
-            raise GraphQLError(
-                "The Follow Request you're trying to deny does not exist"
+        followrequest = reject_followrequest(follow_request_id, get_profile_id(user))
+        if followrequest is None:
+            followrequest = get_unresolvable_followrequest(
+                user, follow_request_id, action="deny"
             )
-
-        if check_permission_user_followrequest(user, followrequest, action="deny"):
-            followrequest.reject()
+            if followrequest.status != FollowRequest.REJECTED:
+                raise GraphQLError("The Follow Request has already been accepted")
 
         return AcceptFollowRequest(followrequest=followrequest)
 
@@ -210,11 +270,8 @@ class StopFollowing(graphene.Mutation):
         - Un usuario puede dejar de seguir a alguien
         """
         user = info.context.user
-        try:
-            followed_profile = Profile.objects.get(pk=id)
-        except Profile.DoesNotExist:
-            raise GraphQLError("The Profile of your request does not exist")
-        followed_profile.followers.remove(user.profile)
+        if not remove_follow(id, get_profile_id(user)):
+            check_profile_exists(id)
         return StopFollowing(ok=True)
 
 
@@ -231,17 +288,15 @@ class DeleteFollower(graphene.Mutation):
         - Un usuario puede eliminar a otro usuario de su lista de seguidores
         """
         user = info.context.user
-        try:
-            follower = Profile.objects.get(pk=id)
-        except Profile.DoesNotExist:
-            raise GraphQLError("The Profile of your request does not exist")
-        user.profile.followers.remove(follower)
+        if not remove_follow(get_profile_id(user), id):
+            check_profile_exists(id)
         return DeleteFollower(ok=True)
 
 
 class Mutation(graphene.ObjectType):
     create_user = CreateUser.Field()
     update_password = UpdatePassword.Field()
+    delete_account = DeleteAccount.Field()
     create_follow_request = CreateFollowRequest.Field()
     accept_follow_request = AcceptFollowRequest.Field()
     deny_follow_request = DenyFollowRequest.Field()
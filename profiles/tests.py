@@ -1,3 +1,690 @@
-from django.test import TestCase
+import json
+import tempfile
+from contextlib import ExitStack
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphql_relay import from_global_id, to_global_id
+
+from ideary.identity_cache import get_cache_key, get_identity_cache
+from ideary.schema import schema
+from ideary.sharding import get_shard, get_shards
+from ideary.testing import BudgetTestCase, IdearyTestCase
+from ideary.warming import (
+    get_popular_profile_ids,
+    is_shared_cache,
+    warm_profile,
+    warm_profile_ideas,
+)
+from ideas.models import Idea
+from profiles.models import (
+    DeletedProfile,
+    FollowRequest,
+    FollowRequestHistory,
+    Profile,
+    User,
+)
+from profiles.profiles_services import (
+    approve_followrequest,
+    archive_followrequests,
+    create_followrequest,
+    get_accounts_to_purge,
+    purge_account,
+    reject_followrequest,
+    request_account_deletion,
+)
+
+
+class ProfilesBudgetTest(BudgetTestCase):
+    def test_profiles(self):
+        def seed(size):
+            for _ in range(size):
+                self.create_user()
+            return [{"rows": Profile.objects.active().count()}]
+
+        self.assertWithinBudgets("profiles", "{ profiles { id } }", seed)
+
+    def test_users(self):
+        def seed(size):
+            for _ in range(size):
+                self.create_user()
+            return [{"rows": User.objects.count()}]
+
+        self.assertWithinBudgets("users", "{ users { id username dateJoined } }", seed)
+
+    def test_me(self):
+        profile = self.create_user()
+        self.assertWithinBudget("me", "{ me { id username } }", 1, user=profile.user)
+
+    def test_followers(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_followers(profile, size)
+            return [{"rows": size, "user": profile.user}]
+
+        self.assertWithinBudgets("followers", "{ followers { id } }", seed)
+
+    def test_following(self):
+        def seed(size):
+            profile = self.create_user()
+            for _ in range(size):
+                self.create_user().followers.add(profile)
+            return [{"rows": size, "user": profile.user}]
+
+        self.assertWithinBudgets("following", "{ following { id } }", seed)
+
+    def test_my_follow_requests(self):
+        def seed(size):
+            profile = self.create_user()
+            self.create_followrequests(profile, size)
+            return [{"rows": size, "user": profile.user}]
+
+        self.assertWithinBudgets(
+            "myFollowRequests", "{ myFollowRequests { id status } }", seed
+        )
+
+    def test_profiles_search(self):
+        def seed(size):
+            for _ in range(size):
+                self.create_user()
+            return [{"rows": Profile.objects.active().count()}]
+
+        self.assertWithinBudgets(
+            "profilesSearch", "{ profilesSearch { edges { node { id } } } }", seed
+        )
+
+    def test_searchable_profiles(self):
+        profile = self.create_user()
+        node_id = to_global_id("ProfileType", profile.pk)
+        self.assertWithinBudget(
+            "searchableProfiles",
+            f'{{ searchableProfiles(id: "{node_id}") {{ id }} }}',
+            1,
+        )
+
+    @override_settings(
+        PASSWORD_HASHING_POOL={"workers": 0, "max_waiting": 0, "timeout": 5}
+    )
+    def test_mutations(self):
+        profile, followed, other, approved, rejected = [
+            self.create_user() for _ in range(5)
+        ]
+        followed.followers.add(profile)
+        approve = create_followrequest(approved.pk, profile.pk)
+        reject = create_followrequest(rejected.pk, profile.pk)
+        for field, query, user in [
+            (
+                "createUser",
+                'mutation { createUser(username: "new", email: "new@ideary.test", '
+                'password: "secret") { user { id } } }',
+                None,
+            ),
+            (
+                "updatePassword",
+                'mutation { updatePassword(password: "secret") { user { id } } }',
+                profile.user,
+            ),
+            (
+                "createFollowRequest",
+                f"mutation {{ createFollowRequest(requestedId: {other.pk}) "
+                "{ followrequest { id } } }",
+                profile.user,
+            ),
+            (
+                "acceptFollowRequest",
+                f"mutation {{ acceptFollowRequest(followRequestId: {approve.pk}) "
+                "{ followrequest { id } } }",
+                profile.user,
+            ),
+            (
+                "denyFollowRequest",
+                f"mutation {{ denyFollowRequest(followRequestId: {reject.pk}) "
+                "{ followrequest { id } } }",
+                profile.user,
+            ),
+            (
+                "stopFollowing",
+                f"mutation {{ stopFollowing(id: {followed.pk}) {{ ok }} }}",
+                profile.user,
+            ),
+            (
+                "deleteFollower",
+                f"mutation {{ deleteFollower(id: {approved.pk}) {{ ok }} }}",
+                profile.user,
+            ),
+            ("deleteAccount", "mutation { deleteAccount { ok } }", profile.user),
+        ]:
+            with self.subTest(field=field):
+                self.assertWithinBudget(field, query, 1, user=user)
+
+
+class ProfilesProjectionTest(IdearyTestCase):
+    def test_projected_followers(self):
+        profile = self.create_user()
+        self.create_followers(profile, 5)
+        self.assertProjected(
+            "followers", "id deletionRequested", "user", user=profile.user
+        )
+
+
+def capture_sql(function):
+    """
+    Calls function and returns the SQL statements it ran in every database
+    """
+    contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+    with ExitStack() as stack:
+        for context in contexts:
+            stack.enter_context(context)
+        function()
+    return [query["sql"] for context in contexts for query in context.captured_queries]
+
+
+class ProfileIdeaSetTest(IdearyTestCase):
+    def test_idea_set(self):
+        """
+        The ideas of the Profiles are limited to the ones visible to the user of the
+        request
+        """
+        owner = self.create_user()
+        [follower] = self.create_followers(owner, 1)
+        stranger = self.create_user()
+        public, protected, private = [
+            idea.pk
+            for visibility in (Idea.PUBLIC, Idea.PROTECTED, Idea.PRIVATE)
+            for idea in self.create_ideas(owner, 1, visibility=visibility)
+        ]
+        for viewer, expected in [
+            (None, [public]),
+            (stranger.user, [public]),
+            (follower.user, [public, protected]),
+            (owner.user, [public, protected, private]),
+        ]:
+            with self.subTest(viewer=viewer):
+                result, _, _ = self.execute(
+                    "{ profiles { id ideaSet { id } } }", viewer
+                )
+                self.assertIsNone(result.errors)
+                [profile] = [
+                    profile
+                    for profile in result.data["profiles"]
+                    if from_global_id(profile["id"])[1] == str(owner.pk)
+                ]
+                self.assertEqual(
+                    sorted(int(idea["id"]) for idea in profile["ideaSet"]), expected
+                )
+
+
+class WarmingTest(IdearyTestCase):
+    def test_warm_profile(self):
+        """
+        A warmed timeline request only runs the authentication of its User and the
+        timeline query (in every shard)
+        """
+        profile = self.create_user()
+        followed = self.create_user()
+        followed.followers.add(profile)
+        self.create_ideas(followed, 5)
+        get_identity_cache().clear()
+        warm_profile(profile.pk, page_size=20)
+        user = User.objects.get(pk=profile.user_id)
+        result, queries, _ = self.execute(
+            "{ timeline { id content } }", user=user, cold=False
+        )
+        self.assertIsNone(result.errors)
+        self.assertEqual(len(result.data["timeline"]), 5)
+        self.assertEqual(queries, 1 + len(get_shards()))
+
+    def test_resolvers_queries(self):
+        """
+        The warming reads the first page of the Idea queries of the resolvers it
+        warms
+        """
+        profile = self.create_user()
+        followed = self.create_user()
+        followed.followers.add(profile)
+        self.create_ideas(followed, 3)
+        user = User.objects.get(pk=profile.user_id)
+        # The profile ideas are warmed as seen by anonymous viewers
+        for warm, query, variables, viewer in [
+            (
+                lambda: warm_profile(profile.pk, 2),
+                "{ timeline { id profile { id } } }",
+                None,
+                user,
+            ),
+            (
+                lambda: warm_profile_ideas(followed.pk, 2),
+                "query ($id: Int) { profileIdeas(userId: $id) { id profile { id } } }",
+                {"id": followed.pk},
+                None,
+            ),
+        ]:
+            warmed = [sql for sql in capture_sql(warm) if "ideas_idea" in sql]
+            executed = capture_sql(lambda: self.execute(query, viewer, variables))
+            self.assertTrue(warmed)
+            for sql in warmed:
+                self.assertTrue(sql.endswith(" LIMIT 2"), sql)
+                self.assertIn(sql[: -len(" LIMIT 2")], executed)
+
+    def test_popular_profile_ids(self):
+        profiles = [self.create_user() for _ in range(3)]
+        for followers, profile in enumerate(profiles):
+            self.create_followers(profile, followers)
+        self.assertEqual(get_popular_profile_ids(2), [profiles[2].pk, profiles[1].pk])
+
+
+class WarmCachesTest(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.active = User.objects.create_user(username="active", email="a@ideary.test")
+        User.objects.filter(pk=self.active.pk).update(last_login=timezone.now())
+        followed = User.objects.create_user(username="followed", email="f@ideary.test")
+        followed.profile.followers.add(self.active.profile)
+
+    def warm_caches(self):
+        out = StringIO()
+        call_command("warm_caches", workers=1, stdout=out)
+        return out.getvalue().strip().splitlines()
+
+    def get_cached_profile(self):
+        cache_key = get_cache_key(Profile, self.active.profile.pk)
+        return get_identity_cache().get(cache_key)
+
+    def test_warm_caches(self):
+        """
+        With a shared identity cache, the command warms the recently active Profiles
+        and the ideas of the most followed ones
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        identity = dict(
+            settings.CACHES["identity"],
+            BACKEND="django.core.cache.backends.filebased.FileBasedCache",
+            LOCATION=directory.name,
+        )
+        with override_settings(CACHES=dict(settings.CACHES, identity=identity)):
+            self.assertTrue(is_shared_cache(get_identity_cache()))
+            self.assertEqual(
+                self.warm_caches(),
+                [
+                    "Warmed 1 timelines and 1 profile ideas (2 tasks completed, 0 failed)"
+                ],
+            )
+            self.assertEqual(self.get_cached_profile(), self.active.profile)
+
+    def test_per_process_cache(self):
+        """
+        With a per process identity cache, the command only warms the database
+        """
+        self.assertFalse(is_shared_cache(get_identity_cache()))
+        get_identity_cache().clear()
+        self.assertEqual(
+            self.warm_caches(),
+            [
+                "The 'identity' cache is per process: warming the database only",
+                "Warmed 1 timelines and 1 profile ideas (2 tasks completed, 0 failed)",
+            ],
+        )
+        self.assertIsNone(self.get_cached_profile())
+
+
+class ArchiveFollowRequestsTest(IdearyTestCase):
+    def test_archive_followrequests(self):
+        """
+        The resolved FollowRequests are archived, and neither can be requested
+        again: the requestor of the approved one already follows, and the rejected
+        one is kept in the history
+        """
+        profile = self.create_user()
+        approved, rejected, pending = [self.create_user() for _ in range(3)]
+        for requestor in (approved, rejected, pending):
+            create_followrequest(requestor.pk, profile.pk)
+        requests = FollowRequest.objects.using(get_shard(profile.pk))
+        approve_followrequest(requests.get(requestor=approved).pk, profile.pk)
+        reject_followrequest(requests.get(requestor=rejected).pk, profile.pk)
+
+        self.assertEqual(archive_followrequests(timezone.now() - timedelta(1)), 0)
+        self.assertEqual(archive_followrequests(timezone.now(), batch_size=1), 2)
+        self.assertEqual(
+            list(requests.values_list("requestor", flat=True)), [pending.pk]
+        )
+        history = FollowRequestHistory.objects.using(get_shard(profile.pk))
+        self.assertEqual(
+            set(history.values_list("requestor_id", "status")),
+            {
+                (approved.pk, FollowRequest.APPROVED),
+                (rejected.pk, FollowRequest.REJECTED),
+            },
+        )
+        self.assertIsNone(create_followrequest(approved.pk, profile.pk))
+        self.assertIsNone(create_followrequest(rejected.pk, profile.pk))
+        # Their other requests are not affected
+        self.assertIsNotNone(create_followrequest(profile.pk, rejected.pk))
+
+
+class FollowLifecycleTest(IdearyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.requestor = self.create_user()
+        self.requested = self.create_user()
+
+    def request_follow(self, requestor, requested_id):
+        result, _, _ = self.execute(
+            f"mutation {{ createFollowRequest(requestedId: {requested_id}) "
+            "{ followrequest { id status } } }",
+            requestor.user,
+        )
+        return result
+
+    def resolve(self, action, profile, followrequest_id):
+        """
+        Executes the accept/deny (action) FollowRequest mutation as profile
+        """
+        result, _, _ = self.execute(
+            f"mutation {{ {action}FollowRequest(followRequestId: {followrequest_id}) "
+            "{ followrequest { id status } } }",
+            profile.user,
+        )
+        return result
+
+    def remove(self, action, profile, profile_id):
+        """
+        Executes the stopFollowing/deleteFollower (action) mutation as profile
+        """
+        result, _, _ = self.execute(
+            f"mutation {{ {action}(id: {profile_id}) {{ ok }} }}", profile.user
+        )
+        return result
+
+    def get_profiles(self, field, profile):
+        """
+        Returns the ids of the Profiles of a list field (followers/following) of
+        profile
+        """
+        result, _, _ = self.execute(f"{{ {field} {{ id }} }}", profile.user)
+        self.assertIsNone(result.errors)
+        return [from_global_id(item["id"])[1] for item in result.data[field]]
+
+    def assertError(self, result, message):
+        self.assertEqual([error.message for error in result.errors], [message])
+
+    def follow(self):
+        """
+        Makes the requestor follow the requested Profile. Returns the id of the
+        approved FollowRequest
+        """
+        result = self.request_follow(self.requestor, self.requested.pk)
+        followrequest_id = result.data["createFollowRequest"]["followrequest"]["id"]
+        result = self.resolve("accept", self.requested, followrequest_id)
+        self.assertIsNone(result.errors)
+        return followrequest_id
+
+    def test_accept(self):
+        result = self.request_follow(self.requestor, self.requested.pk)
+        self.assertIsNone(result.errors)
+        followrequest = result.data["createFollowRequest"]["followrequest"]
+        self.assertEqual(followrequest["status"], "PEN")
+        result, _, _ = self.execute("{ myFollowRequests { id } }", self.requested.user)
+        self.assertEqual(result.data["myFollowRequests"], [{"id": followrequest["id"]}])
+
+        result = self.resolve("accept", self.requested, followrequest["id"])
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            result.data["acceptFollowRequest"]["followrequest"]["status"], "APP"
+        )
+        self.assertEqual(
+            self.get_profiles("followers", self.requested), [str(self.requestor.pk)]
+        )
+        self.assertEqual(
+            self.get_profiles("following", self.requestor), [str(self.requested.pk)]
+        )
+        self.assertEqual(self.get_profiles("followers", self.requestor), [])
+        result, _, _ = self.execute("{ myFollowRequests { id } }", self.requested.user)
+        self.assertEqual(result.data["myFollowRequests"], [])
+
+    def test_duplicate_request(self):
+        self.assertIsNone(self.request_follow(self.requestor, self.requested.pk).errors)
+        message = "It already exists a FollowRequest to that Profile"
+        self.assertError(
+            self.request_follow(self.requestor, self.requested.pk), message
+        )
+        # Nor once approved
+        followrequest = FollowRequest.objects.using(get_shard(self.requested.pk)).get(
+            requestor=self.requestor
+        )
+        self.resolve("accept", self.requested, followrequest.pk)
+        self.assertError(
+            self.request_follow(self.requestor, self.requested.pk), message
+        )
+
+    def test_unknown_profile(self):
+        self.assertError(
+            self.request_follow(self.requestor, 10 ** 6),
+            "The Profile you're trying to follow does not exist",
+        )
+        self.assertError(
+            self.resolve("accept", self.requested, 10 ** 6),
+            "The Follow Request you're trying to accept does not exist",
+        )
+
+    def test_wrong_user(self):
+        result = self.request_follow(self.requestor, self.requested.pk)
+        followrequest_id = result.data["createFollowRequest"]["followrequest"]["id"]
+        intruder = self.create_user()
+        self.assertError(
+            self.resolve("accept", intruder, followrequest_id),
+            "You have not permissions to accept this Follow Request",
+        )
+        self.assertError(
+            self.resolve("deny", self.requestor, followrequest_id),
+            "You have not permissions to deny this Follow Request",
+        )
+        self.assertEqual(self.get_profiles("followers", self.requested), [])
+
+    def test_deny(self):
+        result = self.request_follow(self.requestor, self.requested.pk)
+        followrequest_id = result.data["createFollowRequest"]["followrequest"]["id"]
+        result = self.resolve("deny", self.requested, followrequest_id)
+        self.assertEqual(
+            result.data["denyFollowRequest"]["followrequest"]["status"], "REJ"
+        )
+        self.assertEqual(self.get_profiles("followers", self.requested), [])
+        # A denied FollowRequest can be accepted afterwards, but not the other way
+        self.assertIsNone(
+            self.resolve("accept", self.requested, followrequest_id).errors
+        )
+        self.assertError(
+            self.resolve("deny", self.requested, followrequest_id),
+            "The Follow Request has already been accepted",
+        )
+        self.assertEqual(
+            self.get_profiles("followers", self.requested), [str(self.requestor.pk)]
+        )
+
+    def test_stop_following(self):
+        self.follow()
+        self.assertIsNone(
+            self.remove("stopFollowing", self.requestor, self.requested.pk).errors
+        )
+        self.assertEqual(self.get_profiles("followers", self.requested), [])
+        self.assertEqual(self.get_profiles("following", self.requestor), [])
+        # The FollowRequest is removed along, so it can be requested again
+        self.assertIsNone(self.request_follow(self.requestor, self.requested.pk).errors)
+
+    def test_delete_follower(self):
+        self.follow()
+        self.assertIsNone(
+            self.remove("deleteFollower", self.requested, self.requestor.pk).errors
+        )
+        self.assertEqual(self.get_profiles("followers", self.requested), [])
+        self.assertEqual(self.get_profiles("following", self.requestor), [])
+
+    def test_unfollow_unknown_profile(self):
+        message = "The Profile of your request does not exist"
+        self.assertError(self.remove("stopFollowing", self.requestor, 10 ** 6), message)
+        self.assertError(
+            self.remove("deleteFollower", self.requestor, 10 ** 6), message
+        )
+        # Not followed Profiles that exist are fine
+        self.assertIsNone(
+            self.remove("stopFollowing", self.requestor, self.requested.pk).errors
+        )
+
+
+class AccountDeletionTest(IdearyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = self.create_user()
+        self.other = self.create_user()
+
+    def test_request_account_deletion(self):
+        """
+        The account is disabled and hidden right away, but its data is kept
+        """
+        self.create_ideas(self.profile, 3)
+        request_account_deletion(self.profile.user)
+
+        self.assertFalse(User.objects.get(pk=self.profile.user_id).is_active)
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertIsNotNone(profile.deletion_requested)
+        self.assertEqual(list(Profile.objects.active()), [self.other])
+        self.assertEqual(self.count_ideas(), 0)
+        shard = get_shard(self.profile.pk)
+        self.assertEqual(Idea.objects.using(shard).count(), 3)
+
+    def test_follow_deleted_profile(self):
+        request_account_deletion(self.profile.user)
+        self.assertIsNone(create_followrequest(self.other.pk, self.profile.pk))
+        result, _, _ = self.execute(
+            f"mutation {{ createFollowRequest(requestedId: {self.profile.pk}) "
+            "{ followrequest { id } } }",
+            self.other.user,
+        )
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ["The Profile you're trying to follow does not exist"],
+        )
+
+    def test_get_accounts_to_purge(self):
+        last = self.create_user()
+        request_account_deletion(self.profile.user)
+        request_account_deletion(last.user)
+        self.assertEqual(list(get_accounts_to_purge()), [self.profile, last])
+
+    def test_purge_account(self):
+        """
+        All the data of the Profile is removed (in batches), and only its data
+        """
+        third = self.create_user()
+        self.create_ideas(self.profile, 5)
+        self.create_ideas(self.other, 2)
+        self.profile.followers.add(self.other)
+        self.other.followers.add(self.profile)
+        third.followers.add(self.other)
+        create_followrequest(self.profile.pk, third.pk)
+        create_followrequest(third.pk, self.profile.pk)
+        create_followrequest(third.pk, self.other.pk)
+        request_account_deletion(self.profile.user)
+
+        deleted = purge_account(self.profile, batch_size=2)
+        self.assertEqual(
+            deleted,
+            {
+                Idea._meta.db_table: 5,
+                FollowRequest._meta.db_table: 2,
+                FollowRequestHistory._meta.db_table: 0,
+                Profile.followers.through._meta.db_table: 2,
+                DeletedProfile._meta.db_table: len(get_shards()),
+            },
+        )
+        self.assertFalse(Profile.objects.filter(pk=self.profile.pk).exists())
+        self.assertFalse(User.objects.filter(pk=self.profile.user_id).exists())
+        self.assertEqual(list(get_accounts_to_purge()), [])
+        # The data of the other Profiles is kept
+        shard = get_shard(self.other.pk)
+        self.assertEqual(Idea.objects.using(shard).count(), 2)
+        self.assertEqual(list(third.get_followers()), [self.other])
+        self.assertEqual(
+            list(
+                FollowRequest.objects.using(get_shard(self.other.pk)).values_list(
+                    "requestor", flat=True
+                )
+            ),
+            [third.pk],
+        )
+
+
+@override_settings(PASSWORD_HASHING_POOL={"workers": 0, "max_waiting": 0, "timeout": 5})
+class StaleCacheTest(IdearyTestCase):
+    """
+    The changes made by other processes apply right away to the authentication and
+    the writes (see ideary.identity_cache)
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.profile = self.create_user()
+        self.user = self.profile.user
+        self.user.set_password("secret")
+        self.user.save(update_fields=["password"])
+
+    def post(self, query, token=None):
+        headers = {"HTTP_AUTHORIZATION": f"JWT {token}"} if token else {}
+        response = self.client.post(
+            "/graphql/",
+            json.dumps({"query": query}),
+            content_type="application/json",
+            **headers,
+        )
+        return json.loads(response.content)
+
+    def test_disabled_user(self):
+        token = self.post(
+            f'mutation {{ tokenAuth(username: "{self.user.username}", '
+            'password: "secret") { token } }'
+        )["data"]["tokenAuth"]["token"]
+        self.assertEqual(
+            self.post("{ me { username } }", token)["data"],
+            {"me": {"username": self.user.username}},
+        )
+        # As request_account_deletion run by another process
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        [error] = self.post("{ me { username } }", token)["errors"]
+        self.assertEqual(error["message"], "User is disabled")
+
+    def test_update_password(self):
+        """
+        Updating the password of an outdated User doesn't reactivate it
+        """
+        # Authenticated before another process disabled it
+        request = self.factory.post("/graphql/")
+        request.user = self.user
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        result = schema.execute(
+            'mutation { updatePassword(password: "new") { user { id } } }',
+            context_value=request,
+        )
+        self.assertIsNone(result.errors)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.is_active)
+        self.assertTrue(user.check_password("new"))
+
+    def test_deleted_profile_ideas(self):
+        query = f"{{ profileIdeas(userId: {self.profile.pk}) {{ id }} }}"
+        result, _, _ = self.execute(query, cold=False)
+        self.assertEqual(result.data, {"profileIdeas": []})
+        Profile.objects.filter(pk=self.profile.pk).update(
+            deletion_requested=timezone.now()
+        )
+        result, _, _ = self.execute(query, cold=False)
+        self.assertEqual(
+            [error.message for error in result.errors],
+            ["The requested Profile does not exist"],
+        )